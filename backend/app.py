@@ -1,33 +1,117 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 import os
+import threading
 from dotenv import load_dotenv
 
+from etags import (
+    cache_generation,
+    cached_etag,
+    conditional_json_response,
+    not_modified_response,
+    precondition_matches,
+)
+from instrumentation import init_instrumentation, registry
+from json_provider import FastJSONProvider, PreparedJSON
+from resilience import RepositoryUnavailableError, init_deadlines
+from settings import env_bool, str_to_bool
+from structured_logging import configure_logging, logging_stats
+
+# Load environment variables before importing modules that read them at import time
+load_dotenv()
+
 # Import auth blueprint
 from auth import (
+    USER_RESPONSE_FIELDS,
     auth_bp,
     token_blacklist,
-    fetch_user_by_id,
+    fetch_user_for_response,
+    fields_variant,
     get_firestore_repo,
+    invalid_fields_response,
+    parse_fields_param,
     prepare_user_response,
+    repository_unavailable_response,
+    select_fields,
 )
+from events import event_queue_stats, events_bp
+from export import export_bp
+from firebase_client import get_circuit_breaker, get_email_filter_service
+from leaderboard import leaderboard_bp, start_leaderboard_load
+from progress import progress_bp
+from rate_limit import rate_limiter
+from users import users_bp
 
+def collect_cache_metrics():
+    """Export user cache counters as Prometheus gauges."""
+    repo = get_firestore_repo()
+    if not hasattr(repo, 'cache_stats'):
+        return {}
+    return {
+        f'buddysign_user_cache_{key}': value
+        for key, value in repo.cache_stats().items()
+        if isinstance(value, (int, float))
+    }
 
-def str_to_bool(value, default=False):
-    if value is None:
-        return default
-    if isinstance(value, bool):
-        return value
-    return str(value).strip().lower() in {"1", "true", "t", "yes", "y"}
 
-# Load environment variables
-load_dotenv()
+def collect_event_metrics():
+    """Export event queue counters as Prometheus gauges."""
+    return {
+        f'buddysign_event_queue_{key}': value
+        for key, value in (event_queue_stats() or {}).items()
+    }
+
+
+def collect_circuit_breaker_metrics():
+    """Export the user store circuit breaker as Prometheus gauges (open = 1)."""
+    breaker = get_circuit_breaker()
+    if breaker is None:
+        return {}
+    stats = breaker.stats()
+    metrics = {
+        f'buddysign_circuit_breaker_{key}': value
+        for key, value in stats.items()
+        if isinstance(value, (int, float))
+    }
+    metrics['buddysign_circuit_breaker_open'] = int(stats['state'] != breaker.CLOSED)
+    return metrics
+
+
+def collect_email_filter_metrics():
+    """Export the email filter's state and this worker's skipped lookups as Prometheus gauges."""
+    service = get_email_filter_service()
+    if service is None:
+        return {}
+    return {
+        f'buddysign_email_filter_{key}': value
+        for key, value in service.filter.stats().items()
+        if isinstance(value, (int, float))
+    }
+
+
+def collect_logging_metrics():
+    """Export this worker's log queue counters (including dropped records) as Prometheus gauges."""
+    return {
+        f'buddysign_log_records_{key}': value
+        for key, value in logging_stats().items()
+    }
+
+
+def collect_rate_limit_metrics():
+    """Export this worker's rate limit rejection counts as Prometheus gauges."""
+    return {
+        f'buddysign_rate_limit_rejections_{name}': count
+        for name, count in rate_limiter.rejections.items()
+    }
+
 
 def create_app():
     """Application factory pattern for Flask app creation"""
+    configure_logging()
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     
     # Configuration
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
@@ -43,9 +127,12 @@ def create_app():
     
     # Initialize extensions
     jwt = JWTManager(app)
+    init_instrumentation(app)
+    init_deadlines(app)
     
     # Configure CORS with specific origins
     cors_origins = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:4173,http://localhost:5173,http://localhost:4028').split(',')
+    app.config['CORS_ORIGINS'] = cors_origins
     CORS(app, 
          origins=cors_origins,
          allow_headers=['Content-Type', 'Authorization', 'Access-Control-Allow-Credentials'],
@@ -57,77 +144,175 @@ def create_app():
     def check_if_token_revoked(jwt_header, jwt_payload):
         return jwt_payload.get('jti') in token_blacklist
 
+    # Constant bodies are serialized once; handlers only copy the bytes
+    expired_token_response = PreparedJSON(app, {
+        'success': False,
+        'message': 'Token has expired',
+        'error': 'token_expired'
+    }, 401)
+    invalid_token_response = PreparedJSON(app, {
+        'success': False,
+        'message': 'Invalid token',
+        'error': 'invalid_token'
+    }, 401)
+    missing_token_response = PreparedJSON(app, {
+        'success': False,
+        'message': 'Authorization token required',
+        'error': 'missing_token'
+    }, 401)
+
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
-        return jsonify({
-            'success': False,
-            'message': 'Token has expired',
-            'error': 'token_expired'
-        }), 401
+        return expired_token_response()
     
     @jwt.invalid_token_loader
     def invalid_token_callback(error):
-        return jsonify({
-            'success': False,
-            'message': 'Invalid token',
-            'error': 'invalid_token'
-        }), 401
+        return invalid_token_response()
     
     @jwt.unauthorized_loader
     def missing_token_callback(error):
-        return jsonify({
-            'success': False,
-            'message': 'Authorization token required',
-            'error': 'missing_token'
-        }), 401
+        return missing_token_response()
     
     # Register blueprints
     api_prefix = os.getenv('API_PREFIX', '/api')
+    app.config['API_PREFIX'] = api_prefix
     app.register_blueprint(auth_bp, url_prefix=f'{api_prefix}/auth')
+    app.register_blueprint(users_bp, url_prefix=f'{api_prefix}/users')
+    app.register_blueprint(progress_bp, url_prefix=f'{api_prefix}/progress')
+    app.register_blueprint(events_bp, url_prefix=f'{api_prefix}/events')
+    app.register_blueprint(leaderboard_bp, url_prefix=f'{api_prefix}/leaderboard')
+    app.register_blueprint(export_bp, url_prefix=f'{api_prefix}/export')
+
+    # Scan the repository for the leaderboard off the request path
+    start_leaderboard_load()
     
-    # Health check endpoint
+    # Health check endpoint; only the timestamp changes between responses
+    health_response = PreparedJSON(app, {
+        'success': True,
+        'message': 'BuddySign Flask Backend is running',
+        'status': 'healthy',
+        'timestamp': PreparedJSON.SLOT,
+        'version': os.getenv('APP_VERSION', '1.0.0')
+    })
+
     @app.route('/health', methods=['GET'])
     def health_check():
         """Health check endpoint to verify server status"""
+        return health_response(datetime.utcnow().isoformat())
+
+    @app.route('/health/cache', methods=['GET'])
+    def cache_stats():
+        """Expose user cache counters for tuning USER_CACHE_* settings"""
+        repo = get_firestore_repo()
+        stats = repo.cache_stats() if hasattr(repo, 'cache_stats') else None
         return jsonify({
             'success': True,
-            'message': 'BuddySign Flask Backend is running',
-            'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'version': os.getenv('APP_VERSION', '1.0.0')
+            'data': {
+                'enabled': stats is not None,
+                'user_cache': stats
+            }
         }), 200
-    
-    # API Info endpoint
-    @app.route(f'{api_prefix}/info', methods=['GET'])
-    def api_info():
-        """API information endpoint"""
+
+    @app.route('/health/circuit', methods=['GET'])
+    def circuit_stats():
+        """Expose the user store circuit breaker state and trip counts"""
+        breaker = get_circuit_breaker()
+        return jsonify({
+            'success': True,
+            'data': {
+                'enabled': breaker is not None,
+                'circuit_breaker': breaker.stats() if breaker is not None else None
+            }
+        }), 200
+
+    @app.route('/health/email-filter', methods=['GET'])
+    def email_filter_stats():
+        """Expose the registered-email filter's readiness and skipped lookups"""
+        get_firestore_repo()
+        service = get_email_filter_service()
         return jsonify({
             'success': True,
             'data': {
-                'app_name': os.getenv('APP_NAME', 'BuddySign'),
-                'version': os.getenv('APP_VERSION', '1.0.0'),
-                'api_prefix': api_prefix,
-                'endpoints': {
-                    'auth': {
-                        'signup': f'{api_prefix}/auth/signup',
-                        'login': f'{api_prefix}/auth/login',
-                        'verify_token': f'{api_prefix}/auth/verify-token',
-                        'refresh': f'{api_prefix}/auth/refresh',
-                        'logout': f'{api_prefix}/auth/logout'
-                    },
-                    'health': '/health'
-                }
+                'enabled': service is not None,
+                'email_filter': service.filter.stats() if service is not None else None
             }
         }), 200
+
+    if env_bool('METRICS_ENABLED', False):
+        registry.register_collector(collect_cache_metrics)
+        registry.register_collector(collect_event_metrics)
+        registry.register_collector(collect_rate_limit_metrics)
+        registry.register_collector(collect_circuit_breaker_metrics)
+        registry.register_collector(collect_email_filter_metrics)
+        registry.register_collector(collect_logging_metrics)
+
+        @app.route('/metrics', methods=['GET'])
+        def metrics():
+            """Prometheus metrics endpoint"""
+            return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    # API Info endpoint
+    api_info_response = PreparedJSON(app, {
+        'success': True,
+        'data': {
+            'app_name': os.getenv('APP_NAME', 'BuddySign'),
+            'version': os.getenv('APP_VERSION', '1.0.0'),
+            'api_prefix': api_prefix,
+            'endpoints': {
+                'auth': {
+                    'signup': f'{api_prefix}/auth/signup',
+                    'login': f'{api_prefix}/auth/login',
+                    'verify_token': f'{api_prefix}/auth/verify-token',
+                    'refresh': f'{api_prefix}/auth/refresh',
+                    'logout': f'{api_prefix}/auth/logout'
+                },
+                'users': {
+                    'batch': f'{api_prefix}/users/batch'
+                },
+                'progress': {
+                    'child': f'{api_prefix}/progress/children/<child_id>'
+                },
+                'events': {
+                    'child': f'{api_prefix}/events/children/<child_id>'
+                },
+                'leaderboard': {
+                    'top': f'{api_prefix}/leaderboard',
+                    'child': f'{api_prefix}/leaderboard/children/<child_id>'
+                },
+                'export': {
+                    'children': f'{api_prefix}/export/children'
+                },
+                'health': '/health'
+            }
+        }
+    })
+
+    @app.route(f'{api_prefix}/info', methods=['GET'])
+    def api_info():
+        """API information endpoint"""
+        return api_info_response()
     
     # Protected route example
     @app.route(f'{api_prefix}/profile', methods=['GET'])
     @jwt_required()
     def get_profile():
-        """Return the authenticated user's profile."""
+        """Return the authenticated user's profile, trimmed with ?fields= if given."""
+        try:
+            fields = parse_fields_param(request.args.get('fields'), USER_RESPONSE_FIELDS)
+        except ValueError as e:
+            return invalid_fields_response(e, USER_RESPONSE_FIELDS)
+
         current_user_id = get_jwt_identity()
         repo = get_firestore_repo()
-        user = fetch_user_by_id(current_user_id, repo)
+        variant = fields_variant('profile', fields)
+
+        # Answer a matching If-None-Match from the cached digest without a read
+        etag = cached_etag(repo, current_user_id, variant)
+        if precondition_matches(etag):
+            return not_modified_response(etag)
+
+        generation = cache_generation(repo)
+        user = fetch_user_for_response(current_user_id, repo, fields)
 
         if not user:
             return jsonify({
@@ -136,34 +321,55 @@ def create_app():
                 'error': 'user_not_found'
             }), 404
 
-        user_data = prepare_user_response(user)
+        user_data = select_fields(prepare_user_response(user), fields)
 
-        return jsonify({
-            'success': True,
-            'data': user_data
-        }), 200
+        return conditional_json_response(
+            {'success': True, 'data': user_data},
+            repo, current_user_id, variant, generation
+        )
     
     # Error handlers
+    not_found_response = PreparedJSON(app, {
+        'success': False,
+        'message': 'Endpoint not found',
+        'error': 'not_found'
+    }, 404)
+    internal_error_response = PreparedJSON(app, {
+        'success': False,
+        'message': 'Internal server error',
+        'error': 'internal_server_error'
+    }, 500)
+
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({
-            'success': False,
-            'message': 'Endpoint not found',
-            'error': 'not_found'
-        }), 404
+        return not_found_response()
     
+    @app.errorhandler(RepositoryUnavailableError)
+    def repository_unavailable(error):
+        return repository_unavailable_response(error)
+
     @app.errorhandler(500)
     def internal_error(error):
-        return jsonify({
-            'success': False,
-            'message': 'Internal server error',
-            'error': 'internal_server_error'
-        }), 500
+        return internal_error_response()
     
     return app
 
-# Create Flask app instance
-app = create_app()
+# The module-level app is built on first access (``gunicorn app:app``), so
+# importing this module for create_app() does not construct one.
+_app = None
+_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
+
 
 if __name__ == '__main__':
     host = os.getenv('FLASK_HOST', '0.0.0.0')
@@ -175,4 +381,5 @@ if __name__ == '__main__':
     print(f"🔧 Debug: {debug}")
     print(f"🌐 CORS Origins: {os.getenv('CORS_ORIGINS', 'http://localhost:3000')}")
     
+    app = create_app()
     app.run(host=host, port=port, debug=debug)
\ No newline at end of file
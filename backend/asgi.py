@@ -0,0 +1,323 @@
+"""ASGI entry point for serving BuddySign from an event loop.
+
+The read endpoints hit on every page load (``/auth/verify-token``,
+``/auth/user`` and ``/profile``) are handled by coroutines that use the async
+Firestore repository, so a single worker can keep hundreds of datastore reads
+in flight instead of one per thread. Every other route, including ``OPTIONS``
+preflights, is handed to the regular Flask app through asgiref's
+``WsgiToAsgi`` adapter. The WSGI entry point (``app:app``) is unchanged.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+import math
+import time
+from urllib.parse import parse_qs
+
+import jwt
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from werkzeug.http import parse_cookie, parse_etags
+
+from app import create_app
+from auth import (
+    AUTH_USER_FIELDS,
+    USER_RESPONSE_FIELDS,
+    document_field_mask,
+    fetch_user_by_id,
+    fields_variant,
+    get_firestore_repo,
+    note_profile_version,
+    parse_fields_param,
+    prepare_user_response,
+    select_fields,
+    token_blacklist,
+)
+from etags import compute_etag
+from firebase_client import FirebaseNotConfiguredError, get_async_user_repository
+from instrumentation import record_request
+from profile_snapshot import user_response_from_claims
+from resilience import RepositoryUnavailableError, clear_deadline, deadline_budgets, set_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    """The parts of an ASGI HTTP scope the async views need."""
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {
+            name: values[0]
+            for name, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()
+        }
+        self.headers = {}
+        for name, value in scope.get('headers', []):
+            name, value = name.decode('latin-1').lower(), value.decode('latin-1')
+            if name == 'cookie' and name in self.headers:
+                # HTTP/2 servers send each cookie as its own header
+                value = f"{self.headers[name]}; {value}"
+            self.headers[name] = value
+
+    def cookie(self, name):
+        # Parsed like Flask's request.cookies, so one malformed third-party
+        # cookie does not hide the others
+        return parse_cookie(self.headers.get('cookie', '')).get(name)
+
+
+class AsyncBuddySignApp:
+    """ASGI application: async hot-path views in front of the Flask app."""
+
+    def __init__(self, flask_app, repository=None):
+        self.flask_app = flask_app
+        self._wsgi = WsgiToAsgi(flask_app)
+        self._repository = repository
+        self._async_repo_unavailable = False
+        self._cors_origins = set(flask_app.config.get('CORS_ORIGINS') or [])
+        self._default_budget, self._budgets = deadline_budgets()
+        api_prefix = flask_app.config.get('API_PREFIX', '/api')
+        self._routes = {
+            ('POST', f'{api_prefix}/auth/verify-token'): ('auth.verify_token', self.verify_token),
+            ('GET', f'{api_prefix}/auth/user'): ('auth.get_current_user', self.get_current_user),
+            ('GET', f'{api_prefix}/profile'): ('get_profile', self.get_profile),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] == 'http':
+            route = self._routes.get((scope['method'], scope['path']))
+            if route is not None:
+                endpoint, view = route
+                started = time.perf_counter()
+                request = _Request(scope)
+                # Each request runs in its own task, so the deadline is per request
+                token = set_deadline(self._budgets.get(endpoint, self._default_budget))
+                try:
+                    status, body, headers = await view(request)
+                except RepositoryUnavailableError as e:
+                    status, body, headers = self._unavailable(e)
+                finally:
+                    clear_deadline(token)
+                await self._respond(send, request, status, body, headers)
+                record_request(endpoint, request.method, status, time.perf_counter() - started)
+                return
+        await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _respond(self, send, request, status, body, headers):
+        response_headers = [(b'content-type', b'application/json')] if body else []
+        response_headers += [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                             for name, value in headers.items()]
+        origin = request.headers.get('origin')
+        if origin and (origin in self._cors_origins or '*' in self._cors_origins):
+            response_headers += [
+                (b'access-control-allow-origin', origin.encode('latin-1')),
+                (b'access-control-allow-credentials', b'true'),
+                (b'vary', b'Origin'),
+            ]
+        payload = body.encode('utf-8') if body else b''
+        response_headers.append((b'content-length', str(len(payload)).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    def _json(self, status, envelope, headers=None):
+        return status, f'{self.flask_app.json.dumps(envelope)}\n', headers or {}
+
+    def _unavailable(self, exc):
+        logger.warning("User store unavailable: %s", exc)
+        return self._json(503, {
+            'success': False,
+            'message': 'Service temporarily unavailable, please try again shortly',
+            'error': 'service_unavailable'
+        }, {'Retry-After': str(max(1, math.ceil(exc.retry_after)))})
+
+    def _authenticate(self, request):
+        """Return ``(claims, None)`` or ``(None, error_response)``."""
+        token = request.cookie(self.flask_app.config['JWT_ACCESS_COOKIE_NAME'])
+        if not token:
+            return None, self._json(401, {
+                'success': False,
+                'message': 'Authorization token required',
+                'error': 'missing_token'
+            })
+        try:
+            with self.flask_app.app_context():
+                claims = decode_token(token)
+        except jwt.ExpiredSignatureError:
+            return None, self._json(401, {
+                'success': False,
+                'message': 'Token has expired',
+                'error': 'token_expired'
+            })
+        except (jwt.InvalidTokenError, JWTExtendedException):
+            claims = None
+        if not claims or claims.get('type') != 'access':
+            return None, self._json(401, {
+                'success': False,
+                'message': 'Invalid token',
+                'error': 'invalid_token'
+            })
+        if claims.get('jti') in token_blacklist:
+            return None, self._json(401, {'msg': 'Token has been revoked'})
+        return claims, None
+
+    def _async_repository(self):
+        if self._repository is not None:
+            return self._repository
+        if self._async_repo_unavailable:
+            return None
+        try:
+            self._repository = get_async_user_repository()
+        except FirebaseNotConfiguredError:
+            self._async_repo_unavailable = True
+        return self._repository
+
+    async def _fetch_user(self, user_id, fields=None):
+        """Fetch a user; ``fields`` is a document field mask (None reads everything)."""
+        repo = self._async_repository()
+        if repo is None:
+            # No async backend configured: run the sync lookup off the loop.
+            return await asyncio.to_thread(fetch_user_by_id, user_id, get_firestore_repo(), fields)
+        return note_profile_version(await repo.get_user_by_id(user_id, fields=fields))
+
+    async def _fetch_user_for_response(self, user_id, fields, response_fields):
+        """Async counterpart of ``auth.fetch_user_for_response``."""
+        user = await self._fetch_user(user_id, document_field_mask(fields, response_fields))
+        if user and fields and 'points' in fields and 'points' not in user:
+            user = await self._fetch_user(user_id)
+        return user
+
+    async def verify_token(self, request):
+        claims, error = self._authenticate(request)
+        if error:
+            return error
+        try:
+            user_data = user_response_from_claims(claims)
+            if user_data is None:
+                user = await self._fetch_user(claims['sub'])
+                if not user:
+                    return self._json(404, {'success': False, 'message': 'User not found'})
+                user_data = prepare_user_response(user)
+            return self._json(200, {
+                'success': True,
+                'message': 'Token is valid',
+                'data': {'user': user_data, 'token_valid': True}
+            })
+        except RepositoryUnavailableError as e:
+            return self._unavailable(e)
+        except Exception as e:
+            logger.exception("Async token verification failed")
+            return self._json(500, {
+                'success': False,
+                'message': 'Token verification failed',
+                'error': str(e)
+            })
+
+    async def _conditional_user_view(self, request, variant, not_found, build, response_fields):
+        claims, error = self._authenticate(request)
+        if error:
+            return error
+        try:
+            fields = parse_fields_param(request.args.get('fields'), response_fields)
+        except ValueError as e:
+            return self._json(400, {
+                'success': False,
+                'message': f"Unknown fields: {e}. Allowed fields: {', '.join(response_fields)}",
+                'error': 'invalid_fields'
+            })
+        variant = fields_variant(variant, fields)
+        user_id = claims['sub']
+        repo = self._async_repository()
+        if_none_match = parse_etags(request.headers.get('if-none-match'))
+
+        peek = getattr(repo, 'peek_etag', None)
+        etag = peek(user_id, variant) if peek else None
+        if etag and if_none_match.contains(etag):
+            return 304, '', {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+
+        cache = getattr(repo, 'cache', None)
+        generation = cache.generation if cache is not None else None
+        user = await self._fetch_user_for_response(user_id, fields, response_fields)
+        if not user:
+            return self._json(404, not_found)
+
+        _, body, _ = self._json(200, {'success': True, 'data': select_fields(build(user), fields)})
+        etag = compute_etag(body[:-1])
+        if generation is not None:
+            repo.remember_etag(user_id, variant, etag, generation)
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+        if if_none_match.contains(etag):
+            return 304, '', headers
+        return 200, body, headers
+
+    async def get_current_user(self, request):
+        def build(user):
+            user_data = prepare_user_response(user)
+            user_data['created_at'] = user.get('created_at')
+            return user_data
+
+        try:
+            return await self._conditional_user_view(
+                request, 'auth_user', {'success': False, 'message': 'User not found'}, build,
+                AUTH_USER_FIELDS,
+            )
+        except RepositoryUnavailableError as e:
+            return self._unavailable(e)
+        except Exception as e:
+            logger.exception("Async user fetch failed")
+            return self._json(500, {
+                'success': False,
+                'message': 'Failed to fetch user data',
+                'error': str(e)
+            })
+
+    async def get_profile(self, request):
+        try:
+            return await self._conditional_user_view(
+                request,
+                'profile',
+                {'success': False, 'message': 'User not found', 'error': 'user_not_found'},
+                prepare_user_response,
+                USER_RESPONSE_FIELDS,
+            )
+        except RepositoryUnavailableError as e:
+            return self._unavailable(e)
+        except Exception:
+            # Same body as the Flask app's 500 handler, which serves /profile there
+            logger.exception("Async profile fetch failed")
+            return self._json(500, {
+                'success': False,
+                'message': 'Internal server error',
+                'error': 'internal_server_error'
+            })
+
+
+def create_asgi_app(flask_app=None, repository=None):
+    """Build the ASGI application (``uvicorn --factory asgi:create_asgi_app``)."""
+    return AsyncBuddySignApp(flask_app or create_app(), repository)
+
+
+_application = None
+
+
+def __getattr__(name):
+    # Built on first access (``uvicorn asgi:application``), like ``app.app``.
+    global _application
+    if name != 'application':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _application is None:
+        _application = create_asgi_app()
+    return _application
@@ -9,39 +9,80 @@ from flask_jwt_extended import (
     set_refresh_cookies,
     unset_jwt_cookies
 )
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import logging
+import math
 import os
 import re
+import threading
 from uuid import uuid4
 
-from firebase_client import get_user_repository, FirebaseNotConfiguredError
+from etags import (
+    cache_generation,
+    cached_etag,
+    conditional_json_response,
+    not_modified_response,
+    precondition_matches,
+)
+from firebase_client import (
+    get_user_repository,
+    reset_firestore_clients,
+    user_store_backend,
+    FirebaseNotConfiguredError,
+    UserAlreadyExistsError,
+)
+from instrumentation import timed
+from password_hashing import HashingOverloadedError, get_password_hasher
+from profile_snapshot import (
+    build_profile_claims,
+    profile_versions,
+    snapshot_enabled,
+    user_response_from_claims,
+)
+from progress_counters import merged_children
+from ranking import leaderboard_service
+from rate_limit import client_ip, rate_limiter
+from resilience import RepositoryUnavailableError
+from settings import env_bool, env_float, env_int
+from token_blocklist import create_token_blocklist
+from user_cache import project_user
+from write_behind import create_write_behind_buffer
 
 logger = logging.getLogger(__name__)
+# Per-lookup hit/miss logs; sampled by default (see structured_logging.py)
+lookup_logger = logging.getLogger(f'{__name__}.lookups')
 
 # Create auth blueprint
 auth_bp = Blueprint('auth', __name__)
 
-# In-memory user storage for local fallback (only used when Firebase is unavailable)
+# In-memory user storage for local fallback (used when USER_STORE_BACKEND=memory
+# or Firebase is unavailable)
 users_db = {}
+# Secondary index of user id -> email for the local fallback store
+users_by_id = {}
+# Makes create-if-absent atomic for the local fallback store
+_local_store_lock = threading.Lock()
 
-# Token blacklist for logout functionality
-token_blacklist = set()
+# Revoked token ids for logout functionality, shared by all workers on the host
+token_blacklist = create_token_blocklist()
 
 _firestore_repo = None
 _firebase_warning_logged = False
+_telemetry_buffer = None
 
 
 def get_firestore_repo():
-    """Return the Firestore repository if Firebase is configured."""
+    """Return the user repository selected by ``USER_STORE_BACKEND``.
+
+    Returns None when the in-memory store is in use.
+    """
     global _firestore_repo, _firebase_warning_logged
 
-    if _firestore_repo is None:
+    if _firestore_repo is None and user_store_backend() != 'memory':
         try:
             repo = get_user_repository()
             _firestore_repo = repo
-            logger.info("Firestore repository initialised successfully")
+            logger.info("User repository (%s) initialised successfully", user_store_backend())
         except FirebaseNotConfiguredError as exc:
             if not _firebase_warning_logged:
                 logger.warning("Firebase not configured: %s", exc)
@@ -50,9 +91,54 @@ def get_firestore_repo():
     return _firestore_repo
 
 
+def set_firestore_repo(repo):
+    """Use ``repo`` as the user repository (benchmarks and tooling)."""
+    global _firestore_repo, _telemetry_buffer
+
+    if _telemetry_buffer is not None:
+        _telemetry_buffer.close()
+    _firestore_repo = repo
+    _telemetry_buffer = None
+
+
+def reset_after_fork():
+    """Drop per-process state inherited from a preloading parent (gunicorn post_fork)."""
+    global _firestore_repo, _telemetry_buffer
+
+    reset_firestore_clients()
+    _firestore_repo = None
+    # The parent's flusher thread does not exist here; start a fresh buffer.
+    _telemetry_buffer = None
+
+
+def get_telemetry_buffer(repo):
+    """Return the write-behind buffer used for telemetry fields like last_login."""
+    global _telemetry_buffer
+
+    if _telemetry_buffer is None:
+        _telemetry_buffer = create_write_behind_buffer(
+            repo.batch_update,
+            flush_interval=env_float('WRITE_BEHIND_FLUSH_SECONDS', 5.0),
+            max_batch=env_int('WRITE_BEHIND_BATCH_SIZE', 200),
+            max_pending=env_int('WRITE_BEHIND_MAX_PENDING', 10000),
+        )
+    return _telemetry_buffer
+
+
+def record_user_telemetry(email, fields, repo=None):
+    """Persist telemetry fields without blocking the request when possible."""
+    if not repo:
+        return
+    if env_bool('WRITE_BEHIND_ENABLED', True):
+        if not get_telemetry_buffer(repo).submit(email, fields):
+            logger.warning("Write-behind buffer full; dropped telemetry for %s", email)
+    else:
+        repo.update_user(email, fields)
+
+
 def prepare_user_response(user_record):
     """Transform user record into response payload."""
-    children = user_record.get('children', [])
+    children = merged_children(user_record)
     points = user_record.get('points')
     if points is None:
         points = sum(child.get('points', 0) for child in children)
@@ -67,51 +153,212 @@ def prepare_user_response(user_record):
     }
 
 
+# Response fields that ?fields= can select, and the document fields each is built from
+USER_RESPONSE_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'email': (),
+    'isParent': ('isParent',),
+    'children': ('children', 'child_progress'),
+    'points': ('points',),
+}
+
+# /auth/user also returns the account's creation time
+AUTH_USER_FIELDS = dict(USER_RESPONSE_FIELDS, created_at=('created_at',))
+
+# Read with every field mask: id lookups check the id, and profile_version
+# keeps token profile snapshots honest
+ALWAYS_READ_FIELDS = ('id', 'profile_version')
+
+
+def parse_fields_param(value, allowed):
+    """Parse a comma-separated ``fields`` parameter.
+
+    Returns the requested fields in order, or None when the parameter is
+    missing or empty (all fields). Raises ValueError naming unknown fields.
+    """
+    if value is None:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(', '.join(unknown))
+    return fields or None
+
+
+def invalid_fields_response(exc, allowed):
+    """400 returned for a ``fields`` parameter naming unknown fields."""
+    return jsonify({
+        'success': False,
+        'message': f"Unknown fields: {exc}. Allowed fields: {', '.join(allowed)}",
+        'error': 'invalid_fields'
+    }), 400
+
+
+def fields_variant(variant, fields):
+    """ETag variant for a response trimmed to ``fields``."""
+    return f"{variant}?fields={','.join(sorted(fields))}" if fields else variant
+
+
+def document_field_mask(fields, response_fields=USER_RESPONSE_FIELDS):
+    """Document fields to read for the response ``fields``; None reads everything."""
+    if not fields:
+        return None
+    mask = dict.fromkeys(ALWAYS_READ_FIELDS)
+    for field in fields:
+        mask.update(dict.fromkeys(response_fields[field]))
+    return list(mask)
+
+
+def fetch_user_for_response(user_id, repo, fields=None, response_fields=USER_RESPONSE_FIELDS):
+    """Fetch a user, reading only the document fields the response ``fields`` need."""
+    user = fetch_user_by_id(user_id, repo, document_field_mask(fields, response_fields))
+    if user and fields and 'points' in fields and 'points' not in user:
+        # Accounts without a stored total have it summed from their children
+        user = fetch_user_by_id(user_id, repo)
+    return user
+
+
+def select_fields(user_data, fields):
+    """Trim a response payload to ``fields``; the whole payload when None."""
+    if not fields:
+        return user_data
+    return {field: user_data[field] for field in fields if field in user_data}
+
+
 def store_user_record(email, record, repo=None):
+    """Create a user; raises UserAlreadyExistsError if the email is taken."""
     if repo:
         repo.create_user(email, record)
         logger.debug("Stored user %s in Firestore", email)
     else:
-        users_db[email] = record
+        with _local_store_lock:
+            if email in users_db:
+                raise UserAlreadyExistsError(email)
+            users_db[email] = record
+            users_by_id[str(record['id'])] = email
         logger.debug("Stored user %s in in-memory datastore", email)
 
 
+def note_profile_version(user):
+    if user:
+        profile_versions.note(user['id'], user.get('profile_version', 0))
+    return user
+
+
 def fetch_user_by_email(email, repo=None):
     if repo:
         user = repo.get_user_by_email(email)
-        logger.info(
+        lookup_logger.info(
             "Firestore lookup for email %s returned %s",
             email,
             "hit" if user else "miss",
         )
-        return user
+        return note_profile_version(user)
 
     user = users_db.get(email)
-    logger.info(
+    lookup_logger.info(
         "Local datastore lookup for email %s returned %s",
         email,
         "hit" if user else "miss",
     )
-    return user
+    return note_profile_version(user)
 
 
-def fetch_user_by_id(user_id, repo=None):
+def fetch_user_by_id(user_id, repo=None, fields=None):
+    """Fetch a user by id; ``fields`` limits the document fields read."""
     if repo:
-        user = repo.get_user_by_id(user_id)
-        logger.info(
+        user = repo.get_user_by_id(user_id, fields=fields)
+        lookup_logger.info(
             "Firestore lookup for id %s returned %s",
             user_id,
             "hit" if user else "miss",
         )
-        return user
+        return note_profile_version(user)
+
+    email = users_by_id.get(str(user_id))
+    user = project_user(users_db.get(email), fields) if email else None
+    lookup_logger.info(
+        "Local datastore lookup for id %s returned %s",
+        user_id,
+        "hit" if user else "miss",
+    )
+    return note_profile_version(user)
 
-    for user in users_db.values():
-        if str(user['id']) == str(user_id):
-            logger.info("Local datastore lookup for id %s returned hit", user_id)
-            return user
 
-    logger.info("Local datastore lookup for id %s returned miss", user_id)
-    return None
+def fetch_users_by_ids(user_ids, repo=None):
+    """Fetch many users at once; returns ``{user_id: user}`` for those found."""
+    user_ids = [str(user_id) for user_id in user_ids]
+    if repo:
+        users = repo.get_users_by_ids(user_ids)
+        lookup_logger.info(
+            "Firestore batch lookup for %d ids returned %d users",
+            len(user_ids),
+            len(users),
+        )
+    else:
+        users = {}
+        for user_id in user_ids:
+            email = users_by_id.get(user_id)
+            if email in users_db:
+                users[user_id] = users_db[email]
+    for user in users.values():
+        note_profile_version(user)
+    return users
+
+def hashing_overloaded_response():
+    """503 returned when the password hashing pool is saturated."""
+    return jsonify({
+        'success': False,
+        'message': 'Server is busy, please try again shortly',
+        'error': 'server_busy'
+    }), 503, {'Retry-After': '1'}
+
+
+def repository_unavailable_response(exc):
+    """503 returned when the user store is failing or the request ran out of time."""
+    logger.warning("User store unavailable: %s", exc)
+    return jsonify({
+        'success': False,
+        'message': 'Service temporarily unavailable, please try again shortly',
+        'error': 'service_unavailable'
+    }), 503, {'Retry-After': str(max(1, math.ceil(exc.retry_after)))}
+
+
+def rate_limited(name, value):
+    """Spend a token from a login/signup bucket; returns a 429 response when empty."""
+    decision = rate_limiter.check(name, value)
+    if decision.allowed:
+        return None
+    logger.warning("Rate limit %s exceeded for %s", name, value)
+    return jsonify({
+        'success': False,
+        'message': 'Too many attempts, please try again later',
+        'error': 'rate_limited'
+    }), 429, rate_limiter.headers(name, decision)
+
+
+def request_ip():
+    return client_ip(request.environ, request.remote_addr, rate_limiter.trusted_proxies)
+
+
+def rehash_password_if_needed(email, user, password, repo=None):
+    """Upgrade a stored hash created with outdated KDF parameters."""
+    hasher = get_password_hasher()
+    if not hasher.needs_rehash(user['password_hash']):
+        return
+    try:
+        with timed('password.hash'):
+            new_hash = hasher.hash(password)
+        if repo:
+            repo.update_user(email, {'password_hash': new_hash})
+        else:
+            users_db[email]['password_hash'] = new_hash
+        user['password_hash'] = new_hash
+        logger.info("Rehashed password for %s with %s", email, hasher.method)
+    except Exception:
+        # The login itself succeeded; try again on the next one.
+        logger.warning("Password rehash failed for %s", email, exc_info=True)
 
 def validate_email(email):
     """Validate email format"""
@@ -130,6 +377,10 @@ def signup():
     if request.method == 'OPTIONS':
         return '', 200
     
+    limited = rate_limited('signup_ip', request_ip())
+    if limited:
+        return limited
+
     try:
         data = request.get_json() or {}
 
@@ -160,16 +411,9 @@ def signup():
                 'message': message
             }), 400
 
-        repo = get_firestore_repo()
-        existing_user = fetch_user_by_email(email, repo)
-        if existing_user:
-            return jsonify({
-                'success': False,
-                'message': 'User already exists with this email'
-            }), 409
-
         user_id = str(uuid4())
-        password_hash = generate_password_hash(password)
+        with timed('password.hash'):
+            password_hash = get_password_hasher().hash(password)
 
         new_user = {
             'id': user_id,
@@ -200,9 +444,18 @@ def signup():
                 }
             ],
             'points': 0,
+            'profile_version': 0,
         }
 
-        store_user_record(email, new_user, repo)
+        # One atomic create-if-absent write; no existence check beforehand
+        try:
+            store_user_record(email, new_user, get_firestore_repo())
+        except UserAlreadyExistsError:
+            return jsonify({
+                'success': False,
+                'message': 'User already exists with this email'
+            }), 409
+        leaderboard_service.record_user(new_user)
 
         return jsonify({
             'success': True,
@@ -218,6 +471,10 @@ def signup():
             'success': False,
             'message': 'Invalid age format'
         }), 400
+    except HashingOverloadedError:
+        return hashing_overloaded_response()
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
     except Exception as e:
         logger.exception("Signup failed")
         return jsonify({
@@ -232,6 +489,10 @@ def login():
     if request.method == 'OPTIONS':
         return '', 200
     
+    limited = rate_limited('login_ip', request_ip())
+    if limited:
+        return limited
+
     try:
         data = request.get_json() or {}
         
@@ -245,6 +506,10 @@ def login():
         email = data['email'].lower().strip()
         password = data['password']
         remember_me = data.get('rememberMe', False)
+
+        limited = rate_limited('login_email', email)
+        if limited:
+            return limited
         
         repo = get_firestore_repo()
         user = fetch_user_by_email(email, repo)
@@ -256,23 +521,27 @@ def login():
             }), 404
 
         # Verify password
-        if not check_password_hash(user['password_hash'], password):
+        with timed('password.verify'):
+            password_valid = get_password_hasher().verify(user['password_hash'], password)
+        if not password_valid:
             return jsonify({
                 'success': False,
                 'message': 'Incorrect password',
                 'error': 'invalid_password'
             }), 401
+        rehash_password_if_needed(email, user, password, repo)
         
         # Create tokens with extended expiry if remember me is checked
         token_expires = timedelta(days=30) if remember_me else timedelta(hours=1)
-        access_token = create_access_token(
-            identity=str(user['id']), 
-            expires_delta=token_expires
-        )
-        refresh_token = create_refresh_token(identity=str(user['id']))
+        with timed('jwt.create'):
+            access_token = create_access_token(
+                identity=str(user['id']), 
+                expires_delta=token_expires,
+                additional_claims=build_profile_claims(user)
+            )
+            refresh_token = create_refresh_token(identity=str(user['id']))
         user['last_login'] = datetime.utcnow().isoformat()
-        if repo:
-            repo.update_user(email, {'last_login': user['last_login']})
+        record_user_telemetry(email, {'last_login': user['last_login']}, repo)
         
         # Prepare user data for frontend (matching existing structure)
         user_data = prepare_user_response(user)
@@ -294,6 +563,10 @@ def login():
         set_refresh_cookies(response, refresh_token)
         return response, 200
         
+    except HashingOverloadedError:
+        return hashing_overloaded_response()
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
     except Exception as e:
         logger.exception("Login failed")
         return jsonify({
@@ -311,7 +584,8 @@ def verify_token():
     
     try:
         current_user_id = get_jwt_identity()
-        jti = get_jwt()['jti']
+        claims = get_jwt()
+        jti = claims['jti']
         
         # Check if token is blacklisted
         if jti in token_blacklist:
@@ -320,16 +594,19 @@ def verify_token():
                 'message': 'Token has been revoked'
             }), 401
         
-        repo = get_firestore_repo()
-        user = fetch_user_by_id(current_user_id, repo)
-        if not user:
-            return jsonify({
-                'success': False,
-                'message': 'User not found'
-            }), 404
-        
-        # Prepare user data
-        user_data = prepare_user_response(user)
+        # Answer from the signed profile snapshot when it is still current
+        user_data = user_response_from_claims(claims)
+        if user_data is None:
+            repo = get_firestore_repo()
+            user = fetch_user_by_id(current_user_id, repo)
+            if not user:
+                return jsonify({
+                    'success': False,
+                    'message': 'User not found'
+                }), 404
+
+            # Prepare user data
+            user_data = prepare_user_response(user)
         
         return jsonify({
             'success': True,
@@ -340,6 +617,8 @@ def verify_token():
             }
         }), 200
         
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -356,9 +635,19 @@ def refresh():
     
     try:
         current_user_id = get_jwt_identity()
+
+        additional_claims = {}
+        if snapshot_enabled():
+            user = fetch_user_by_id(current_user_id, get_firestore_repo())
+            if user:
+                additional_claims = build_profile_claims(user)
         
         # Create new access token
-        new_access_token = create_access_token(identity=current_user_id)
+        with timed('jwt.create'):
+            new_access_token = create_access_token(
+                identity=current_user_id,
+                additional_claims=additional_claims
+            )
 
         response = jsonify({
             'success': True,
@@ -372,6 +661,8 @@ def refresh():
         set_access_cookies(response, new_access_token)
         return response, 200
         
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -387,8 +678,8 @@ def logout():
         return '', 200
     
     try:
-        jti = get_jwt()['jti']
-        token_blacklist.add(jti)
+        jwt_data = get_jwt()
+        token_blacklist.add(jwt_data['jti'], jwt_data['exp'])
 
         response = jsonify({
             'success': True,
@@ -411,10 +702,23 @@ def get_current_user():
     if request.method == 'OPTIONS':
         return '', 200
     
+    try:
+        fields = parse_fields_param(request.args.get('fields'), AUTH_USER_FIELDS)
+    except ValueError as e:
+        return invalid_fields_response(e, AUTH_USER_FIELDS)
+
     try:
         current_user_id = get_jwt_identity()
         repo = get_firestore_repo()
-        user = fetch_user_by_id(current_user_id, repo)
+        variant = fields_variant('auth_user', fields)
+
+        # Answer a matching If-None-Match from the cached digest without a read
+        etag = cached_etag(repo, current_user_id, variant)
+        if precondition_matches(etag):
+            return not_modified_response(etag)
+
+        generation = cache_generation(repo)
+        user = fetch_user_for_response(current_user_id, repo, fields, AUTH_USER_FIELDS)
         
         if not user:
             return jsonify({
@@ -426,11 +730,13 @@ def get_current_user():
         user_data = prepare_user_response(user)
         user_data['created_at'] = user.get('created_at')
         
-        return jsonify({
-            'success': True,
-            'data': user_data
-        }), 200
+        return conditional_json_response(
+            {'success': True, 'data': select_fields(user_data, fields)},
+            repo, current_user_id, variant, generation
+        )
         
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -0,0 +1,28 @@
+"""One-off backfill of the Firestore id -> email index for existing users.
+
+Usage: python backfill_id_index.py [--batch-size 400]
+"""
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+from firebase_client import FirestoreUserRepository, get_firestore_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=400,
+                        help='index entries per Firestore batch commit (max 500)')
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    repo = FirestoreUserRepository(get_firestore_client())
+    written = repo.backfill_id_index(batch_size=args.batch_size)
+    print(f"Indexed {written} users")
+
+
+if __name__ == '__main__':
+    main()
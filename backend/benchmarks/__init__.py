@@ -0,0 +1,4 @@
+"""Benchmark scripts for the BuddySign backend.
+
+Run them from the ``backend`` directory, e.g. ``python -m benchmarks.bench_password_hashing``.
+"""
@@ -0,0 +1,151 @@
+"""Compare concurrent ``/auth/verify-token`` throughput: WSGI threads vs ASGI.
+
+Both modes read from the same in-memory repository with injected latency, so
+the benchmark measures how many datastore waits each serving model can overlap:
+
+* ``wsgi`` drives the Flask app from ``--threads`` threads, like a gthread
+  worker with that many threads.
+* ``asgi`` drives ``asgi.AsyncBuddySignApp`` from ``--concurrency`` asyncio
+  tasks on a single event loop, like one uvicorn worker.
+
+    python -m benchmarks.bench_async_verify --latency-ms 20 --threads 16 --concurrency 256
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from uuid import uuid4
+
+
+def seed_users(store, count):
+    user_ids = []
+    for index in range(count):
+        user_id = str(uuid4())
+        store.store(f'bench-{index}@example.com', {
+            'id': user_id,
+            'name': f'Bench {index}',
+            'isParent': True,
+            'children': [],
+            'points': 0,
+        })
+        user_ids.append(user_id)
+    return user_ids
+
+
+def run_wsgi(app, path, cookie_name, tokens, threads, duration):
+    completed = [0] * threads
+    failures = [0] * threads
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        client = app.test_client()
+        client.set_cookie(cookie_name, tokens[index % len(tokens)])
+        while time.perf_counter() < deadline:
+            status = client.post(path).status_code
+            if status == 200:
+                completed[index] += 1
+            else:
+                failures[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'threads': threads,
+        'requests': sum(completed),
+        'failures': sum(failures),
+        'req_per_sec': round(sum(completed) / elapsed, 2),
+    }
+
+
+async def run_asgi(asgi_app, path, cookie_name, tokens, concurrency, duration):
+    completed = 0
+    failures = 0
+    deadline = time.perf_counter() + duration
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def worker(index):
+        nonlocal completed, failures
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': path,
+            'headers': [(b'cookie', f'{cookie_name}={tokens[index % len(tokens)]}'.encode())],
+        }
+        status = {}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+
+        while time.perf_counter() < deadline:
+            await asgi_app(scope, receive, send)
+            if status.get('code') == 200:
+                completed += 1
+            else:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'concurrency': concurrency,
+        'requests': completed,
+        'failures': failures,
+        'req_per_sec': round(completed / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='verify-token throughput: WSGI vs ASGI')
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--threads', type=int, default=16, help='WSGI request threads')
+    parser.add_argument('--concurrency', type=int, default=256, help='ASGI in-flight requests')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per mode')
+    args = parser.parse_args()
+
+    # Measure the datastore path, not the token snapshot or cache shortcuts.
+    os.environ['TOKEN_PROFILE_SNAPSHOT_ENABLED'] = 'false'
+    os.environ.setdefault('TOKEN_BLOCKLIST_BACKEND', 'memory')
+
+    from flask_jwt_extended import create_access_token
+
+    from app import create_app
+    from asgi import AsyncBuddySignApp
+    from auth import set_firestore_repo
+    from benchmarks.fake_repository import AsyncInMemoryUserRepository, InMemoryUserRepository
+
+    store = InMemoryUserRepository(latency=args.latency_ms / 1000)
+    user_ids = seed_users(store, args.users)
+    set_firestore_repo(store)
+
+    app = create_app()
+    with app.app_context():
+        tokens = [create_access_token(identity=user_id) for user_id in user_ids]
+    path = f"{app.config['API_PREFIX']}/auth/verify-token"
+    cookie_name = app.config['JWT_ACCESS_COOKIE_NAME']
+
+    results = {'latency_ms': args.latency_ms, 'duration_s': args.duration}
+    results['wsgi'] = run_wsgi(app, path, cookie_name, tokens, args.threads, args.duration)
+
+    asgi_app = AsyncBuddySignApp(app, AsyncInMemoryUserRepository(store))
+    results['asgi'] = asyncio.run(
+        run_asgi(asgi_app, path, cookie_name, tokens, args.concurrency, args.duration)
+    )
+    results['speedup'] = round(
+        results['asgi']['req_per_sec'] / max(results['wsgi']['req_per_sec'], 1e-9), 2
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
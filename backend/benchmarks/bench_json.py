@@ -0,0 +1,96 @@
+"""Compare JSON response encoding: stdlib provider vs orjson, and prepared bodies.
+
+Encodes a profile envelope with ``--children`` children through each
+provider's ``response()`` (what ``jsonify`` calls), then serves ``/health``
+and ``/info`` through the test client with ``JSON_PROVIDER`` set to each
+backend.
+
+    python -m benchmarks.bench_json --children 50 --ops 20000
+"""
+import argparse
+import json
+import os
+import time
+
+
+def profile_envelope(children):
+    return {
+        'success': True,
+        'data': {
+            'id': 'bench-user',
+            'name': 'Bench Parent',
+            'email': 'bench@example.com',
+            'isParent': True,
+            'points': 1234,
+            'children': [
+                {
+                    'id': f'child-{index}',
+                    'name': f'Child {index}',
+                    'age': 7,
+                    'grade': 'Grade 2',
+                    'favoriteColor': '🟦 Blue',
+                    'dateAdded': '2024-01-01',
+                    'lastActive': 'Just created',
+                    'avatar': 'C',
+                    'points': index * 10,
+                    'level': 1 + index % 5,
+                    'lessonsCompleted': index,
+                    'testsAttended': index // 2,
+                    'currentStreak': 3,
+                    'averageScore': 87.5,
+                    'totalTime': 3600,
+                    'strengths': ['alphabet', 'numbers'],
+                    'weaknesses': ['colours'],
+                }
+                for index in range(children)
+            ],
+        },
+    }
+
+
+def per_op_us(elapsed, ops):
+    return round(elapsed / ops * 1e6, 2)
+
+
+def run_backend(backend, envelope, ops, api_prefix):
+    os.environ['JSON_PROVIDER'] = backend
+    from app import create_app
+
+    app = create_app()
+    results = {'provider': app.json.backend}
+
+    with app.app_context():
+        started = time.perf_counter()
+        for _ in range(ops):
+            app.json.response(envelope)
+        results['profile_response_us'] = per_op_us(time.perf_counter() - started, ops)
+        results['profile_bytes'] = len(app.json.response(envelope).get_data())
+
+    client = app.test_client()
+    for name, path in (('health', '/health'), ('info', f'{api_prefix}/info')):
+        started = time.perf_counter()
+        for _ in range(ops):
+            client.get(path)
+        results[f'{name}_request_us'] = per_op_us(time.perf_counter() - started, ops)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON provider benchmark')
+    parser.add_argument('--children', type=int, default=50)
+    parser.add_argument('--ops', type=int, default=20000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('USER_STORE_BACKEND', 'memory')
+    envelope = profile_envelope(args.children)
+    api_prefix = os.getenv('API_PREFIX', '/api')
+    print(json.dumps({
+        'children': args.children,
+        'ops': args.ops,
+        'results': [run_backend(backend, envelope, args.ops, api_prefix)
+                    for backend in ('stdlib', 'orjson')],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
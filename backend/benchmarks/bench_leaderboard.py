@@ -0,0 +1,91 @@
+"""Benchmark the in-memory leaderboard at a realistic population size.
+
+Loads ``--entries`` children with random points, then measures incremental
+point updates, top-N queries and rank-of-child lookups. A full sort per
+top-N query (what a cache of an order-by query would have to redo after
+every update) is timed as the baseline.
+
+    python -m benchmarks.bench_leaderboard --entries 1000000 --ops 100000
+"""
+import argparse
+import heapq
+import json
+import random
+import time
+
+
+def per_op_us(elapsed, ops):
+    return round(elapsed / ops * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Leaderboard benchmark')
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--ops', type=int, default=100_000, help='operations per measurement')
+    parser.add_argument('--top', type=int, default=10, help='N for top-N queries')
+    parser.add_argument('--max-points', type=int, default=100_000)
+    parser.add_argument('--load', type=int, default=1000, help='SortedKeyList sublist size')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    from ranking import Leaderboard
+
+    rng = random.Random(args.seed)
+    child_ids = [f'child-{i:07d}' for i in range(args.entries)]
+    entries = [
+        {'childId': child_id, 'name': child_id, 'level': 1,
+         'points': rng.randrange(args.max_points)}
+        for child_id in child_ids
+    ]
+
+    board = Leaderboard(load=args.load)
+    started = time.perf_counter()
+    board.load(entries)
+    load_seconds = time.perf_counter() - started
+
+    update_ids = [rng.choice(child_ids) for _ in range(args.ops)]
+    deltas = [rng.randrange(1, 50) for _ in range(args.ops)]
+    started = time.perf_counter()
+    for child_id, delta in zip(update_ids, deltas):
+        board.add_points(child_id, delta)
+    update_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(args.ops):
+        board.top(args.top)
+    top_seconds = time.perf_counter() - started
+
+    offsets = [rng.randrange(args.entries) for _ in range(args.ops)]
+    started = time.perf_counter()
+    for offset in offsets:
+        board.top(args.top, offset)
+    top_offset_seconds = time.perf_counter() - started
+
+    rank_ids = [rng.choice(child_ids) for _ in range(args.ops)]
+    started = time.perf_counter()
+    for child_id in rank_ids:
+        board.rank(child_id)
+    rank_seconds = time.perf_counter() - started
+
+    # Baseline: recompute top-N from the id -> points map on every query.
+    points = {entry['childId']: entry['points'] for entry in entries}
+    baseline_ops = max(1, min(20, args.ops))
+    started = time.perf_counter()
+    for _ in range(baseline_ops):
+        heapq.nlargest(args.top, points.items(), key=lambda item: item[1])
+    baseline_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        'entries': args.entries,
+        'ops': args.ops,
+        'load_seconds': round(load_seconds, 3),
+        'update_us': per_op_us(update_seconds, args.ops),
+        'top_n_us': per_op_us(top_seconds, args.ops),
+        'top_n_at_random_offset_us': per_op_us(top_offset_seconds, args.ops),
+        'rank_us': per_op_us(rank_seconds, args.ops),
+        'baseline_scan_top_n_us': per_op_us(baseline_seconds, baseline_ops),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
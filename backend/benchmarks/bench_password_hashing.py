@@ -0,0 +1,96 @@
+"""Compare login password verification inline vs in the hashing process pool.
+
+Client threads play the role of request threads: each repeatedly verifies a
+stored hash, exactly as ``login`` does. Alongside them a probe thread times a
+cheap request-shaped operation to show how much hashing stalls the rest of the
+worker. Results are printed as JSON.
+
+    python -m benchmarks.bench_password_hashing --threads 8 --duration 10
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from password_hashing import HashingOverloadedError, PasswordHasher
+
+
+def run_mode(hasher, password_hash, threads, duration):
+    stop = threading.Event()
+    completed = [0] * threads
+    rejected = [0] * threads
+    probe_latencies = []
+
+    def client(index):
+        while not stop.is_set():
+            try:
+                hasher.verify(password_hash, 'correct horse')
+                completed[index] += 1
+            except HashingOverloadedError:
+                rejected[index] += 1
+
+    def probe():
+        payload = {'success': True, 'data': {'id': 'x' * 36, 'children': [{}] * 5}}
+        while not stop.is_set():
+            started = time.perf_counter()
+            json.dumps(payload)
+            probe_latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.005)
+
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    workers.append(threading.Thread(target=probe))
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(duration)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    cores = hasher.workers if hasher.workers > 0 else min(threads, os.cpu_count() or 1)
+    logins_per_sec = sum(completed) / elapsed
+    probe_latencies.sort()
+    return {
+        'logins_per_sec': round(logins_per_sec, 2),
+        'logins_per_sec_per_core': round(logins_per_sec / cores, 2),
+        'cores_used': cores,
+        'rejected_per_sec': round(sum(rejected) / elapsed, 2),
+        'probe_p50_ms': round(statistics.median(probe_latencies), 3) if probe_latencies else None,
+        'probe_p99_ms': round(probe_latencies[int(len(probe_latencies) * 0.99) - 1], 3)
+        if probe_latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Password hashing throughput benchmark')
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent login threads')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='process pool size for the pooled run')
+    parser.add_argument('--max-pending', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per mode')
+    args = parser.parse_args()
+
+    password_hash = generate_password_hash('correct horse', args.method)
+    results = {'method': args.method, 'threads': args.threads}
+
+    inline = PasswordHasher(args.method, workers=0, max_pending=args.threads)
+    results['inline'] = run_mode(inline, password_hash, args.threads, args.duration)
+
+    pooled = PasswordHasher(args.method, workers=args.workers, max_pending=args.max_pending)
+    pooled.verify(password_hash, 'warm-up')  # start the pool outside the timed run
+    try:
+        results['pool'] = run_mode(pooled, password_hash, args.threads, args.duration)
+    finally:
+        pooled.shutdown()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Measure cold-start time to the first ``/health`` response.
+
+Each run starts a fresh interpreter with ``-X importtime`` that imports
+``app``, builds the app and serves one ``/health`` request through the test
+client. The wall time from spawning the process to receiving that response
+is reported, along with the slowest imports from the last run.
+``--eager-firebase`` imports the Firebase SDK first, to show what the
+startup cost was before it became a lazy import.
+
+    python -m benchmarks.bench_startup --runs 10 --target-ms 800
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CHILD = """
+import json, sys
+{preload}
+import app
+response = app.create_app().test_client().get('/health')
+print(json.dumps({{'status': response.status_code,
+                  'firebase_imported': 'firebase_admin' in sys.modules}}), flush=True)
+"""
+
+
+def parse_importtime(stderr, top, depth):
+    """Return the ``top`` slowest imports nested at most ``depth`` levels deep."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        # Each nesting level is indented by two more spaces.
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level >= depth:
+            continue
+        imports.append({
+            'module': name.strip(),
+            'depth': level,
+            'self_ms': round(int(self_us) / 1000, 2),
+            'cumulative_ms': round(int(cumulative_us) / 1000, 2),
+        })
+    return sorted(imports, key=lambda item: item['cumulative_ms'], reverse=True)[:top]
+
+
+def run_once(preload):
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', CHILD.format(preload=preload)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    line = process.stdout.readline()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _, stderr = process.communicate()
+    if process.returncode != 0 or not line:
+        raise SystemExit(f'Startup run failed:\n{stderr[-2000:]}')
+    return elapsed_ms, json.loads(line), stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start benchmark')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=1000.0,
+                        help='target median time to the first response')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='list imports nested at most this deep (1 = top level)')
+    parser.add_argument('--eager-firebase', action='store_true',
+                        help='import firebase_admin.firestore before the app')
+    args = parser.parse_args()
+
+    preload = ''
+    if args.eager_firebase:
+        preload = 'from firebase_admin import firestore, firestore_async'
+
+    # The first run warms the bytecode cache and is not counted.
+    run_once(preload)
+    timings = []
+    for _ in range(args.runs):
+        elapsed_ms, result, stderr = run_once(preload)
+        timings.append(elapsed_ms)
+
+    timings.sort()
+    median = statistics.median(timings)
+    print(json.dumps({
+        'runs': args.runs,
+        'eager_firebase': args.eager_firebase,
+        'firebase_imported': result['firebase_imported'],
+        'status': result['status'],
+        'min_ms': round(timings[0], 1),
+        'median_ms': round(median, 1),
+        'max_ms': round(timings[-1], 1),
+        'target_ms': args.target_ms,
+        'meets_target': median <= args.target_ms,
+        'slowest_imports': parse_importtime(stderr, args.top, args.depth),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
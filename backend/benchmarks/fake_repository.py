@@ -0,0 +1,188 @@
+"""In-memory stand-ins for the Firestore user repositories used by the benchmarks.
+
+Every call waits ``latency`` seconds (plus up to ``jitter`` seconds of random
+extra) to mimic a Firestore round trip, so results reflect how the app
+behaves when it is I/O bound rather than how fast a dict is.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from firebase_client import UserAlreadyExistsError
+from progress_counters import derived_points
+from user_cache import project_user
+
+
+class InMemoryUserRepository:
+    """Thread-safe dict-backed repository with injected latency."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._emails_by_id: Dict[str, str] = {}
+        self.events: Dict[str, List[Dict[str, Any]]] = {}
+        self.calls: Dict[str, int] = {}
+
+    def delay(self, name: str) -> float:
+        """Count a call and return how long it should take."""
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        return self.latency + (random.random() * self.jitter if self.jitter else 0.0)
+
+    def _round_trip(self, name: str) -> None:
+        delay = self.delay(name)
+        if delay > 0:
+            time.sleep(delay)
+
+    # Latency-free data operations, shared with AsyncInMemoryUserRepository.
+
+    def load_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user = self._users.get(email)
+            return dict(copy.deepcopy(user), email=email) if user else None
+
+    def load_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            email = self._emails_by_id.get(str(user_id))
+        return self.load_by_email(email) if email else None
+
+    def store(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._users[email] = copy.deepcopy(data)
+            if data.get("id") is not None:
+                self._emails_by_id[str(data["id"])] = email
+        return data
+
+    def insert(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a new user; raises UserAlreadyExistsError like ``create_user``."""
+        with self._lock:
+            if email in self._users:
+                raise UserAlreadyExistsError(email)
+            self._users[email] = copy.deepcopy(data)
+            if data.get("id") is not None:
+                self._emails_by_id[str(data["id"])] = email
+        return data
+
+    def apply_updates(self, updates_by_email: Dict[str, Dict[str, Any]], strict: bool) -> None:
+        with self._lock:
+            for email, updates in updates_by_email.items():
+                if email not in self._users:
+                    if strict:
+                        raise KeyError(email)
+                    continue
+                self._users[email].update(copy.deepcopy(updates))
+
+    def apply_child_progress(self, email: str, child_id: str, increments: Dict[str, int]) -> None:
+        with self._lock:
+            user = self._users[email]
+            if user.get("points") is None:
+                user["points"] = derived_points(user)
+            progress = user.setdefault("child_progress", {}).setdefault(str(child_id), {})
+            for counter, amount in increments.items():
+                progress[counter] = progress.get(counter, 0) + amount
+            user["points"] += increments.get("points", 0)
+            user["profile_version"] = user.get("profile_version", 0) + 1
+
+    # Repository interface.
+
+    def get_user_by_email(self, email: str,
+                          fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        self._round_trip("get_user_by_email")
+        return project_user(self.load_by_email(email), fields)
+
+    def get_user_by_id(self, user_id: str,
+                       fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        self._round_trip("get_user_by_id")
+        return project_user(self.load_by_id(user_id), fields)
+
+    def get_users_by_emails(self, emails: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        self._round_trip("get_users_by_emails")
+        users = {email: self.load_by_email(email) for email in emails}
+        return {email: user for email, user in users.items() if user}
+
+    def get_users_by_ids(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        self._round_trip("get_users_by_ids")
+        users = {str(user_id): self.load_by_id(user_id) for user_id in user_ids}
+        return {user_id: user for user_id, user in users.items() if user}
+
+    def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        self._round_trip("create_user")
+        return self.insert(email, data)
+
+    def update_user(self, email: str, updates: Dict[str, Any]) -> None:
+        self._round_trip("update_user")
+        self.apply_updates({email: updates}, strict=True)
+
+    def increment_child_progress(self, email: str, child_id: str,
+                                 increments: Dict[str, int], backfill_points: bool = False) -> None:
+        self._round_trip("increment_child_progress")
+        self.apply_child_progress(email, child_id, increments)
+
+    def batch_update(self, updates_by_email: Dict[str, Dict[str, Any]]) -> None:
+        self._round_trip("batch_update")
+        self.apply_updates(updates_by_email, strict=False)
+
+    def append_events(self, events_by_email: Dict[str, List[Dict[str, Any]]]) -> None:
+        self._round_trip("append_events")
+        with self._lock:
+            for email, events in events_by_email.items():
+                self.events.setdefault(email, []).extend(copy.deepcopy(events))
+
+    def iter_users(self, page_size: int = 500,
+                   fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            emails = sorted(self._users)
+        for start in range(0, len(emails), page_size):
+            self._round_trip("iter_users")
+            for email in emails[start:start + page_size]:
+                user = self.load_by_email(email)
+                if user:
+                    yield user
+
+    def backfill_id_index(self, batch_size: int = 400) -> int:
+        return 0
+
+
+class AsyncInMemoryUserRepository:
+    """Async view of an :class:`InMemoryUserRepository` using ``asyncio.sleep``.
+
+    Shares the wrapped repository's data, so users created through the sync
+    Flask routes are visible to the async views.
+    """
+
+    def __init__(self, store: InMemoryUserRepository):
+        self._store = store
+
+    async def _round_trip(self, name: str) -> None:
+        delay = self._store.delay(name)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def get_user_by_email(self, email: str,
+                                fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        await self._round_trip("get_user_by_email")
+        return project_user(self._store.load_by_email(email), fields)
+
+    async def get_user_by_id(self, user_id: str,
+                             fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        await self._round_trip("get_user_by_id")
+        return project_user(self._store.load_by_id(user_id), fields)
+
+    async def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        await self._round_trip("create_user")
+        return self._store.insert(email, data)
+
+    async def update_user(self, email: str, updates: Dict[str, Any]) -> None:
+        await self._round_trip("update_user")
+        self._store.apply_updates({email: updates}, strict=True)
+
+    async def batch_update(self, updates_by_email: Dict[str, Dict[str, Any]]) -> None:
+        await self._round_trip("batch_update")
+        self._store.apply_updates(updates_by_email, strict=False)
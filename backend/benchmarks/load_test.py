@@ -0,0 +1,242 @@
+"""Endpoint load test against ``create_app()`` backed by an in-memory repository.
+
+The app is served by Werkzeug's threaded server on a loopback port and driven
+by ``--concurrency`` client threads. Each client signs up its own account,
+logs in, then issues a weighted mix of requests until ``--duration`` expires.
+Per-endpoint throughput and latency percentiles are written as JSON so runs
+can be compared between releases.
+
+    python -m benchmarks.load_test --concurrency 32 --duration 30 --latency-ms 20 \\
+        --mix verify_token=50,profile=20,login=10,refresh=10,signup=5,logout=5 \\
+        --output load_test.json
+
+Password hashing dominates ``signup``/``login``; pass e.g.
+``--hash-method pbkdf2:sha256:1000`` to focus on the rest of the stack.
+Login/signup rate limiting is switched off unless ``--rate-limit`` is given,
+which uses a per-run in-memory limiter, so the numbers measure the endpoints
+rather than 429s, and no counters carry over between runs.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from uuid import uuid4
+
+DEFAULT_MIX = 'verify_token=50,profile=20,login=10,refresh=10,signup=5,logout=5'
+PASSWORD = 'load-test-password'
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Client:
+    """One simulated browser session with its own cookie jar."""
+
+    def __init__(self, base_url, api_prefix):
+        self.base_url = base_url
+        self.api_prefix = api_prefix
+        self.email = f'load-{uuid4().hex[:12]}@example.com'
+        self.logged_in = False
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(
+            f'{self.base_url}{self.api_prefix}{path}',
+            data=data,
+            method=method,
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            with self._opener.open(req, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code
+
+    def signup(self, email=None):
+        return self.request('POST', '/auth/signup', {
+            'parentEmail': email or f'load-{uuid4().hex[:12]}@example.com',
+            'password': PASSWORD,
+            'childName': 'Bench',
+            'childAge': '7',
+        })
+
+    def login(self):
+        status = self.request('POST', '/auth/login', {'email': self.email, 'password': PASSWORD})
+        self.logged_in = status == 200
+        return status
+
+    def logout(self):
+        status = self.request('POST', '/auth/logout', {})
+        self.logged_in = False
+        return status
+
+
+ENDPOINTS = {
+    'signup': (lambda c: c.signup(), {201}),
+    'login': (lambda c: c.login(), {200}),
+    'verify_token': (lambda c: c.request('POST', '/auth/verify-token', {}), {200}),
+    'refresh': (lambda c: c.request('POST', '/auth/refresh', {}), {200}),
+    'profile': (lambda c: c.request('GET', '/profile'), {200}),
+    'logout': (lambda c: c.logout(), {200}),
+}
+
+
+def run_client(client, mix, deadline, samples, lock):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    local = []
+    while time.perf_counter() < deadline:
+        # A logged-out session has to log in again before anything else.
+        name = 'login' if not client.logged_in else random.choices(names, weights)[0]
+        action, expected = ENDPOINTS[name]
+        started = time.perf_counter()
+        status = action(client)
+        local.append((name, status, status in expected, time.perf_counter() - started))
+    with lock:
+        samples.extend(local)
+
+
+def summarise(samples, elapsed):
+    by_endpoint = {}
+    for name, status, ok, latency in samples:
+        entry = by_endpoint.setdefault(name, {'latencies': [], 'errors': 0, 'statuses': {}})
+        entry['latencies'].append(latency * 1000)
+        entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+        if not ok:
+            entry['errors'] += 1
+
+    results = {}
+    for name, entry in sorted(by_endpoint.items()):
+        latencies = sorted(entry['latencies'])
+        results[name] = {
+            'requests': len(latencies),
+            'errors': entry['errors'],
+            'statuses': entry['statuses'],
+            'req_per_sec': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+        }
+    all_latencies = sorted(latency * 1000 for _, _, _, latency in samples)
+    results['_overall'] = {
+        'requests': len(all_latencies),
+        'errors': sum(entry['errors'] for entry in by_endpoint.values()),
+        'req_per_sec': round(len(all_latencies) / elapsed, 2),
+        'p50_ms': round(percentile(all_latencies, 50) or 0, 3),
+        'p95_ms': round(percentile(all_latencies, 95) or 0, 3),
+        'p99_ms': round(percentile(all_latencies, 99) or 0, 3),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BuddySign endpoint load test')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0, help='measured seconds')
+    parser.add_argument('--latency-ms', type=float, default=10.0,
+                        help='injected latency per repository call')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint=weight list')
+    parser.add_argument('--hash-method', default=None, help='override PASSWORD_HASH_METHOD')
+    parser.add_argument('--cache', action='store_true',
+                        help='wrap the fake repository in the user cache')
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='keep login/signup rate limiting on (per-run in-memory buckets)')
+    parser.add_argument('--output', default=None, help='write JSON results to this file')
+    args = parser.parse_args()
+
+    if args.hash_method:
+        os.environ['PASSWORD_HASH_METHOD'] = args.hash_method
+    os.environ.setdefault('TOKEN_BLOCKLIST_BACKEND', 'memory')
+    os.environ['RATE_LIMIT_ENABLED'] = 'true' if args.rate_limit else 'false'
+    os.environ['RATE_LIMIT_BACKEND'] = 'memory'
+
+    from werkzeug.serving import make_server
+
+    from app import create_app
+    from auth import set_firestore_repo
+    from benchmarks.fake_repository import InMemoryUserRepository
+    from settings import env_float, env_int
+    from user_cache import CachingUserRepository, UserCache
+
+    mix = parse_mix(args.mix)
+    repo = InMemoryUserRepository(args.latency_ms / 1000, args.jitter_ms / 1000)
+    if args.cache:
+        repo = CachingUserRepository(repo, UserCache(
+            max_size=env_int('USER_CACHE_MAX_SIZE', 1024),
+            ttl_seconds=env_float('USER_CACHE_TTL_SECONDS', 60.0),
+        ))
+    set_firestore_repo(repo)
+
+    app = create_app()
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    api_prefix = os.getenv('API_PREFIX', '/api')
+
+    clients = [Client(base_url, api_prefix) for _ in range(args.concurrency)]
+    for client in clients:
+        client.signup(client.email)
+        client.login()
+
+    samples, lock = [], threading.Lock()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=run_client, args=(client, mix, deadline, samples, lock))
+        for client in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    report = {
+        'config': {
+            'concurrency': args.concurrency,
+            'duration_s': round(elapsed, 3),
+            'latency_ms': args.latency_ms,
+            'jitter_ms': args.jitter_ms,
+            'mix': mix,
+            'cache': args.cache,
+            'rate_limit': args.rate_limit,
+            'hash_method': os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+        },
+        'endpoints': summarise(samples, elapsed),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+"""Bloom filter of registered emails, shared by the workers on a host.
+
+Most failed logins are for addresses that were never registered, and each
+one costs a datastore read that finds nothing. :class:`EmailFilter` answers
+"definitely not registered" without that read: a Bloom filter never gives a
+false negative, so only its false positives (at ``false_positive_rate``)
+still reach the datastore.
+
+The filter lives in a memory-mapped file at ``EMAIL_FILTER_PATH``. Every
+worker on the host maps the same file, so an email added by ``create_user``
+in one worker is visible to the others at once, and the file doubles as the
+snapshot a restarted process reuses instead of rescanning the users
+collection. Bits are only ever set, never cleared: adds and rebuilds OR into
+the live filter under an exclusive ``flock``, and lookups read without
+locking. Until the first full scan has completed the filter is not *ready*
+and every lookup goes to the datastore.
+
+Users created by processes that do not share the file (another host) are
+only picked up by the next rebuild, every ``EMAIL_FILTER_REBUILD_SECONDS``;
+until then those users would be told they do not exist. Enable the filter
+only when every writer shares the file.
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from firebase_client import UserAlreadyExistsError
+from settings import env_bool, env_float, env_int, env_str, state_path
+
+logger = logging.getLogger(__name__)
+
+
+# magic, version, bit count, hash count, ready flag, built_at, emails added
+_HEADER = struct.Struct("<4sIQIIdQ")
+_MAGIC = b"BSEF"
+_VERSION = 1
+_HEADER_SIZE = 64
+_READY_OFFSET = 20
+
+# Emails OR'd into the filter per lock acquisition during a rebuild.
+_BUILD_CHUNK = 1000
+
+
+def bloom_parameters(capacity: int, false_positive_rate: float) -> tuple:
+    """Bits and hash functions for ``capacity`` items at ``false_positive_rate``."""
+    capacity = max(1, capacity)
+    rate = min(max(false_positive_rate, 1e-9), 0.5)
+    num_bits = math.ceil(-capacity * math.log(rate) / math.log(2) ** 2)
+    num_bits = max(64, (num_bits + 7) // 8 * 8)
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    return num_bits, num_hashes
+
+
+class EmailFilter:
+    """Memory-mapped Bloom filter of emails; see the module docstring."""
+
+    def __init__(self, path: str, capacity: int = 1_000_000,
+                 false_positive_rate: float = 0.01,
+                 clock: Callable[[], float] = time.time):
+        self._path = path
+        self._capacity = capacity
+        self._false_positive_rate = false_positive_rate
+        self._num_bits, self._num_hashes = bloom_parameters(capacity, false_positive_rate)
+        self._clock = clock
+        self._open_lock = threading.Lock()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._pid: Optional[int] = None
+        self.definite_misses = 0
+        self.passed = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _size(self) -> int:
+        return _HEADER_SIZE + self._num_bits // 8
+
+    def _header_matches(self, header: bytes) -> bool:
+        magic, version, num_bits, num_hashes, _, _, _ = _HEADER.unpack_from(header)
+        return (magic, version, num_bits, num_hashes) == (
+            _MAGIC, _VERSION, self._num_bits, self._num_hashes
+        )
+
+    def _create_file(self) -> None:
+        """Replace the file with an empty filter of this size (not ready)."""
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".email_filter.")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                header = _HEADER.pack(_MAGIC, _VERSION, self._num_bits, self._num_hashes, 0, 0.0, 0)
+                file.write(header.ljust(_HEADER_SIZE, b"\0"))
+                file.truncate(self._size())
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _mapping(self) -> mmap.mmap:
+        # flock locks belong to the open file, which a forked child would
+        # share with its parent, so each process opens the file itself.
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        with self._open_lock:
+            if self._map is not None and self._pid == os.getpid():
+                return self._map
+            while True:
+                file = open(self._path, "a+b")
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    file.seek(0)
+                    valid = (os.fstat(file.fileno()).st_size == self._size()
+                             and self._header_matches(file.read(_HEADER.size)))
+                    if valid:
+                        break
+                    if os.fstat(file.fileno()).st_ino == os.stat(self._path).st_ino:
+                        logger.info("Creating email filter at %s (%d bits, %d hashes)",
+                                    self._path, self._num_bits, self._num_hashes)
+                        self._create_file()
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+                # The file was replaced under us; open the new one.
+                file.close()
+            self._file = file
+            self._map = mmap.mmap(file.fileno(), self._size())
+            self._pid = os.getpid()
+            return self._map
+
+    @contextmanager
+    def _locked(self) -> Iterator[mmap.mmap]:
+        mapping = self._mapping()
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            yield mapping
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _header(self) -> tuple:
+        return _HEADER.unpack_from(self._mapping())
+
+    def _positions(self, email: str) -> Iterator[int]:
+        digest = hashlib.blake2b(email.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self._num_hashes):
+            yield (first + index * second) % self._num_bits
+
+    def _set_bits(self, mapping: mmap.mmap, email: str) -> None:
+        for position in self._positions(email):
+            offset = _HEADER_SIZE + position // 8
+            mapping[offset] |= 1 << (position % 8)
+
+    def _update_header(self, mapping: mmap.mmap, **changes: Any) -> None:
+        magic, version, num_bits, num_hashes, ready, built_at, added = _HEADER.unpack_from(mapping)
+        _HEADER.pack_into(
+            mapping, 0, magic, version, num_bits, num_hashes,
+            changes.get("ready", ready), changes.get("built_at", built_at),
+            added + changes.get("added", 0),
+        )
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._header()[4])
+
+    @property
+    def built_at(self) -> Optional[float]:
+        """When the last full scan finished, or None if none has."""
+        return self._header()[5] if self.ready else None
+
+    def is_stale(self, max_age: float) -> bool:
+        built_at = self.built_at
+        return built_at is None or self._clock() - built_at >= max_age
+
+    def might_contain(self, email: str) -> bool:
+        """False only if ``email`` was definitely never added."""
+        mapping = self._mapping()
+        if not mapping[_READY_OFFSET]:
+            return True
+        for position in self._positions(email):
+            if not mapping[_HEADER_SIZE + position // 8] & (1 << (position % 8)):
+                self.definite_misses += 1
+                return False
+        self.passed += 1
+        return True
+
+    def add(self, email: str) -> None:
+        with self._locked() as mapping:
+            self._set_bits(mapping, email)
+            self._update_header(mapping, added=1)
+
+    def build(self, emails: Iterable[str]) -> int:
+        """OR every email into the filter and mark it ready; returns the count.
+
+        Emails added concurrently are kept, since bits are never cleared.
+        """
+        count = 0
+        chunk: List[str] = []
+        for email in emails:
+            chunk.append(email)
+            if len(chunk) >= _BUILD_CHUNK:
+                count += self._add_chunk(chunk)
+                chunk = []
+        count += self._add_chunk(chunk)
+        with self._locked() as mapping:
+            self._update_header(mapping, ready=1, built_at=self._clock())
+        return count
+
+    def _add_chunk(self, emails: List[str]) -> int:
+        if emails:
+            with self._locked() as mapping:
+                for email in emails:
+                    self._set_bits(mapping, email)
+                self._update_header(mapping, added=len(emails))
+        return len(emails)
+
+    @contextmanager
+    def build_lock(self) -> Iterator[bool]:
+        """Yield True if this process may rebuild now, False if another one is."""
+        with open(f"{self._path}.build", "a+b") as file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict[str, Any]:
+        mapping = self._mapping()
+        _, _, num_bits, num_hashes, ready, built_at, added = _HEADER.unpack_from(mapping)
+        fill = int.from_bytes(mapping[_HEADER_SIZE:], "little").bit_count() / num_bits
+        return {
+            "ready": bool(ready),
+            "built_at": built_at if ready else None,
+            "capacity": self._capacity,
+            "target_false_positive_rate": self._false_positive_rate,
+            "estimated_false_positive_rate": round(fill ** num_hashes, 6),
+            "bits": num_bits,
+            "hashes": num_hashes,
+            "fill_ratio": round(fill, 6),
+            "emails_added": added,
+            "definite_misses": self.definite_misses,
+            "passed": self.passed,
+        }
+
+
+class EmailFilterService:
+    """Keeps an :class:`EmailFilter` built from the repository.
+
+    ``loader`` returns every registered email. The first scan and each
+    rebuild after ``rebuild_seconds`` run on a background thread in one
+    process per host; lookups go to the datastore until the first one
+    finishes.
+    """
+
+    def __init__(self, email_filter: EmailFilter, loader: Callable[[], Iterable[str]],
+                 rebuild_seconds: float = 3600.0):
+        self.filter = email_filter
+        self.loader = loader
+        self._rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._checked_at = 0.0
+
+    def ensure_built(self) -> None:
+        """Start a background rebuild if the filter is missing or stale."""
+        now = time.monotonic()
+        if self._rebuilding or now - self._checked_at < 1.0:
+            return
+        self._checked_at = now
+        if not self.filter.is_stale(self._rebuild_seconds):
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_quietly, name="email-filter-rebuild",
+                         daemon=True).start()
+
+    def rebuild(self) -> bool:
+        """Scan the repository into the filter; False if another process is doing it."""
+        with self.filter.build_lock() as acquired:
+            if not acquired:
+                return False
+            # Another process may have finished a rebuild while we waited.
+            if not self.filter.is_stale(self._rebuild_seconds):
+                return True
+            started = time.monotonic()
+            count = self.filter.build(self.loader())
+            logger.info("Email filter rebuilt with %d emails in %.2fs",
+                        count, time.monotonic() - started)
+            return True
+
+    def _rebuild_quietly(self) -> None:
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Email filter rebuild failed")
+        finally:
+            self._rebuilding = False
+
+
+class EmailFilteredUserRepository:
+    """Answer lookups for unregistered emails from the filter.
+
+    ``get_user_by_email`` returns None without a datastore read when the
+    filter rules the email out; ``create_user`` adds the email. All other
+    calls go straight to the wrapped repository.
+    """
+
+    def __init__(self, repository: Any, service: EmailFilterService):
+        self._repository = repository
+        self._service = service
+
+    @property
+    def email_filter(self) -> EmailFilter:
+        return self._service.filter
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._repository, name)
+
+    def _might_exist(self, email: str) -> bool:
+        self._service.ensure_built()
+        return self._service.filter.might_contain(email)
+
+    def get_user_by_email(self, email: str,
+                          fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        if not self._might_exist(email):
+            return None
+        return self._repository.get_user_by_email(email, fields=fields)
+
+    def get_users_by_emails(self, emails: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        candidates = [email for email in dict.fromkeys(emails) if self._might_exist(email)]
+        return self._repository.get_users_by_emails(candidates) if candidates else {}
+
+    def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            user = self._repository.create_user(email, data)
+        except UserAlreadyExistsError:
+            self._service.filter.add(email)
+            raise
+        self._service.filter.add(email)
+        return user
+
+
+class AsyncEmailFilteredUserRepository(EmailFilteredUserRepository):
+    """Async counterpart of :class:`EmailFilteredUserRepository`."""
+
+    async def get_user_by_email(self, email: str,
+                                fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        if not self._might_exist(email):
+            return None
+        return await self._repository.get_user_by_email(email, fields=fields)
+
+    async def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            user = await self._repository.create_user(email, data)
+        except UserAlreadyExistsError:
+            self._service.filter.add(email)
+            raise
+        self._service.filter.add(email)
+        return user
+
+
+def email_filter_enabled() -> bool:
+    return env_bool("EMAIL_FILTER_ENABLED", False)
+
+
+def create_email_filter_service(repository: Any) -> EmailFilterService:
+    """Build the filter service from ``EMAIL_FILTER_*`` settings.
+
+    ``repository`` is scanned (emails only) to build the filter.
+    """
+    path = env_str("EMAIL_FILTER_PATH") or state_path("email_filter.bloom")
+    email_filter = EmailFilter(
+        path,
+        capacity=env_int("EMAIL_FILTER_CAPACITY", 1_000_000),
+        false_positive_rate=env_float("EMAIL_FILTER_FALSE_POSITIVE_RATE", 0.01),
+    )
+
+    def load_emails() -> Iterator[str]:
+        for user in repository.iter_users(fields=["id"]):
+            yield user["email"]
+
+    return EmailFilterService(
+        email_filter, load_emails,
+        rebuild_seconds=env_float("EMAIL_FILTER_REBUILD_SECONDS", 3600.0),
+    )
@@ -0,0 +1,63 @@
+"""Conditional (ETag / If-None-Match) responses for user payloads.
+
+The ETag is a digest of the serialized response body. When the repository
+is a :class:`user_cache.CachingUserRepository`, the digest is remembered next
+to the cached user record, so a matching ``If-None-Match`` can be answered
+with ``304 Not Modified`` before any datastore read or serialization. The
+digest is dropped whenever the cached record is invalidated.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Optional
+
+from flask import current_app, request
+
+
+def compute_etag(body: str) -> str:
+    return hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def cache_generation(repo: Any) -> Optional[int]:
+    cache = getattr(repo, "cache", None)
+    return cache.generation if cache is not None else None
+
+
+def cached_etag(repo: Any, user_id: str, variant: str) -> Optional[str]:
+    peek = getattr(repo, "peek_etag", None)
+    return peek(user_id, variant) if peek else None
+
+
+def not_modified_response(etag: str):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def precondition_matches(etag: Optional[str]) -> bool:
+    return bool(etag) and request.if_none_match.contains(etag)
+
+
+def conditional_json_response(
+    envelope: Any,
+    repo: Any = None,
+    user_id: Optional[str] = None,
+    variant: str = "",
+    generation: Optional[int] = None,
+):
+    """Serialize ``envelope`` once, tag it with an ETag and honour If-None-Match."""
+    body = current_app.json.dumps(envelope)
+    etag = compute_etag(body)
+
+    remember = getattr(repo, "remember_etag", None)
+    if remember and user_id is not None and generation is not None:
+        remember(user_id, variant, etag, generation)
+
+    if precondition_matches(etag):
+        return not_modified_response(etag)
+
+    response = current_app.response_class(f"{body}\n", mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,216 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from collections import deque
+from datetime import datetime
+import json
+import logging
+import threading
+
+from auth import fetch_user_by_id, get_firestore_repo, repository_unavailable_response
+from resilience import RepositoryUnavailableError
+from settings import env_float, env_int
+from write_behind import create_event_queue
+
+logger = logging.getLogger(__name__)
+
+# Create events blueprint
+events_bp = Blueprint('events', __name__)
+
+NDJSON_MIMETYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl'}
+EVENT_TYPES = {'sign_attempt', 'quiz_answer', 'lesson_completed', 'test_completed'}
+MAX_TEXT_LENGTH = 64
+MAX_DURATION_MS = 24 * 60 * 60 * 1000
+
+# Local fallback store of (email, event) pairs (only used when Firebase is
+# unavailable); bounded, with the oldest events dropped first
+events_db = deque(maxlen=env_int('EVENTS_LOCAL_MAX', 50000))
+
+_event_queue = None
+_event_queue_lock = threading.Lock()
+
+
+class EventValidationError(ValueError):
+    """Raised for a malformed line in an event batch."""
+
+
+def persist_events(events_by_email):
+    """Flush callback: write a chunk of queued events grouped by user."""
+    repo = get_firestore_repo()
+    if repo:
+        repo.append_events(events_by_email)
+    else:
+        for email, events in events_by_email.items():
+            events_db.extend((email, event) for event in events)
+
+
+def get_event_queue():
+    """Return the process-wide queue that buffers events until they are flushed."""
+    global _event_queue
+
+    if _event_queue is None:
+        with _event_queue_lock:
+            if _event_queue is None:
+                _event_queue = create_event_queue(
+                    persist_events,
+                    flush_interval=env_float('EVENTS_FLUSH_SECONDS', 1.0),
+                    max_batch=env_int('EVENTS_BATCH_SIZE', 400),
+                    max_pending=env_int('EVENTS_MAX_PENDING', 50000),
+                )
+    return _event_queue
+
+
+def event_queue_stats():
+    """Counters of the event queue, or None before the first event is queued."""
+    return _event_queue.stats() if _event_queue is not None else None
+
+
+def _text(raw, field):
+    value = raw.get(field)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise EventValidationError(f'{field} must be a string')
+    value = str(value)
+    if len(value) > MAX_TEXT_LENGTH:
+        raise EventValidationError(f'{field} is longer than {MAX_TEXT_LENGTH} characters')
+    return value
+
+
+def _number(raw, field, minimum, maximum, integer=False):
+    value = raw.get(field)
+    if value is None:
+        return None
+    allowed = int if integer else (int, float)
+    if isinstance(value, bool) or not isinstance(value, allowed) or not minimum <= value <= maximum:
+        kind = 'an integer' if integer else 'a number'
+        raise EventValidationError(f'{field} must be {kind} between {minimum} and {maximum}')
+    return value
+
+
+def validate_event(raw):
+    """Return the stored form of one event, keeping only known fields."""
+    if not isinstance(raw, dict):
+        raise EventValidationError('event must be a JSON object')
+    if raw.get('type') not in EVENT_TYPES:
+        raise EventValidationError(f'type must be one of: {", ".join(sorted(EVENT_TYPES))}')
+
+    event = {'type': raw['type']}
+    for field in ('lessonId', 'sign'):
+        value = _text(raw, field)
+        if value is not None:
+            event[field] = value
+    if 'correct' in raw:
+        if not isinstance(raw['correct'], bool):
+            raise EventValidationError('correct must be a boolean')
+        event['correct'] = raw['correct']
+    for field, minimum, maximum, integer in (
+        ('score', 0, 100, False),
+        ('durationMs', 0, MAX_DURATION_MS, True),
+        ('ts', 1, 2 ** 53, True),
+    ):
+        value = _number(raw, field, minimum, maximum, integer)
+        if value is not None:
+            event[field] = value
+    return event
+
+
+def iter_ndjson_events(stream, max_events, max_line_bytes):
+    """Yield validated events from an NDJSON body without buffering all of it.
+
+    Raises :class:`EventValidationError` naming the first offending line.
+    """
+    line_number = 0
+    count = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > max_line_bytes:
+            raise EventValidationError(f'line {line_number}: longer than {max_line_bytes} bytes')
+        line = line.strip()
+        if not line:
+            continue
+        count += 1
+        if count > max_events:
+            raise EventValidationError(f'at most {max_events} events can be sent at once')
+        try:
+            raw = json.loads(line)
+        except ValueError:
+            raise EventValidationError(f'line {line_number}: invalid JSON') from None
+        try:
+            yield validate_event(raw)
+        except EventValidationError as exc:
+            raise EventValidationError(f'line {line_number}: {exc}') from None
+
+
+@events_bp.route('/children/<child_id>', methods=['POST', 'OPTIONS'])
+@jwt_required()
+def ingest_child_events(child_id):
+    """Accept an NDJSON batch of lesson/test events for one child"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        if request.mimetype not in NDJSON_MIMETYPES:
+            return jsonify({
+                'success': False,
+                'message': 'Send events as application/x-ndjson, one JSON object per line'
+            }), 415
+
+        user = fetch_user_by_id(get_jwt_identity(), get_firestore_repo())
+        if not user:
+            return jsonify({
+                'success': False,
+                'message': 'User not found',
+                'error': 'user_not_found'
+            }), 404
+
+        if not any(str(child.get('id')) == child_id for child in user.get('children', [])):
+            return jsonify({
+                'success': False,
+                'message': 'Child not found',
+                'error': 'child_not_found'
+            }), 404
+
+        received_at = datetime.utcnow().isoformat()
+        try:
+            events = [
+                dict(event, childId=child_id, receivedAt=received_at)
+                for event in iter_ndjson_events(
+                    request.stream,
+                    env_int('EVENTS_MAX_PER_REQUEST', 1000),
+                    env_int('EVENTS_MAX_LINE_BYTES', 4096),
+                )
+            ]
+        except EventValidationError as exc:
+            return jsonify({
+                'success': False,
+                'message': str(exc),
+                'error': 'invalid_event'
+            }), 400
+
+        if events and not get_event_queue().submit_many(user['email'], events):
+            return jsonify({
+                'success': False,
+                'message': 'Server is busy, please try again shortly',
+                'error': 'server_busy'
+            }), 503, {'Retry-After': '1'}
+
+        return jsonify({
+            'success': True,
+            'message': 'Events accepted',
+            'data': {
+                'accepted': len(events)
+            }
+        }), 202
+
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
+    except Exception as e:
+        logger.exception("Event ingestion failed")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to accept events',
+            'error': str(e)
+        }), 500
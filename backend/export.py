@@ -0,0 +1,192 @@
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime
+import csv
+import itertools
+import logging
+
+from auth import fetch_user_by_id, get_firestore_repo, repository_unavailable_response, users_db
+from firebase_client import is_user_store_outage
+from progress_counters import merged_children
+from resilience import RepositoryUnavailableError
+from settings import env_int
+from users import is_admin
+
+logger = logging.getLogger(__name__)
+
+# Create export blueprint
+export_bp = Blueprint('export', __name__)
+
+# One row per child, in this column order for CSV
+EXPORT_COLUMNS = (
+    'parentId', 'parentEmail', 'parentName',
+    'childId', 'childName', 'age', 'grade', 'level',
+    'points', 'lessonsCompleted', 'testsAttended', 'currentStreak',
+    'averageScore', 'totalTime', 'strengths', 'weaknesses',
+    'dateAdded', 'lastActive',
+)
+
+# Only the fields child rows are built from are read while paging
+EXPORT_FIELDS = ['id', 'name', 'children', 'child_progress']
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Bytes buffered before a chunk is handed to the server
+CHUNK_BYTES = 64 * 1024
+
+# Leading characters spreadsheet apps treat as a formula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def child_rows(user):
+    """Yield an export row for every child of a user record."""
+    for child in merged_children(user):
+        yield {
+            'parentId': user.get('id'),
+            'parentEmail': user.get('email'),
+            'parentName': user.get('name'),
+            'childId': child.get('id'),
+            'childName': child.get('name'),
+            'age': child.get('age'),
+            'grade': child.get('grade'),
+            'level': child.get('level'),
+            'points': child.get('points', 0),
+            'lessonsCompleted': child.get('lessonsCompleted', 0),
+            'testsAttended': child.get('testsAttended', 0),
+            'currentStreak': child.get('currentStreak', 0),
+            'averageScore': child.get('averageScore', 0),
+            'totalTime': child.get('totalTime', 0),
+            'strengths': child.get('strengths', []),
+            'weaknesses': child.get('weaknesses', []),
+            'dateAdded': child.get('dateAdded'),
+            'lastActive': child.get('lastActive'),
+        }
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        value = ';'.join(str(item) for item in value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        # Keep user-entered text from running as a spreadsheet formula
+        return f"'{value}"
+    return value
+
+
+class _LineBuffer:
+    """File-like target that hands back what csv.writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def encode_csv(rows):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[column]) for column in EXPORT_COLUMNS])
+
+
+def encode_ndjson(rows):
+    dumps = current_app.json.dumps
+    for row in rows:
+        yield f'{dumps(row)}\n'
+
+
+def chunked(lines, chunk_bytes=CHUNK_BYTES):
+    """Join encoded lines into chunks of roughly ``chunk_bytes`` bytes."""
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_export_users(repo):
+    """Yield every user with the export fields, one page in memory at a time."""
+    if repo:
+        return repo.iter_users(page_size=env_int('EXPORT_PAGE_SIZE', 200), fields=EXPORT_FIELDS)
+    return iter(list(users_db.values()))
+
+
+@export_bp.route('/children', methods=['GET', 'OPTIONS'])
+@jwt_required()
+def export_children():
+    """Stream children's progress as CSV or NDJSON (?format=, ?scope=mine|all)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'message': f"format must be one of: {', '.join(EXPORT_FORMATS)}",
+            'error': 'invalid_format'
+        }), 400
+
+    scope = request.args.get('scope', 'mine').lower()
+    if scope not in ('mine', 'all'):
+        return jsonify({
+            'success': False,
+            'message': 'scope must be mine or all',
+            'error': 'invalid_scope'
+        }), 400
+
+    current_user_id = get_jwt_identity()
+    if scope == 'all' and not is_admin(current_user_id):
+        return jsonify({
+            'success': False,
+            'message': 'Not allowed to export other accounts',
+            'error': 'forbidden'
+        }), 403
+
+    try:
+        repo = get_firestore_repo()
+        if scope == 'mine':
+            user = fetch_user_by_id(current_user_id, repo, EXPORT_FIELDS)
+            if not user:
+                return jsonify({
+                    'success': False,
+                    'message': 'User not found',
+                    'error': 'user_not_found'
+                }), 404
+            users = iter([user])
+        else:
+            users = iter_export_users(repo)
+            # Read the first page now so an unavailable store is still a 503;
+            # iter_users is not behind the circuit breaker, so its transport
+            # errors arrive untranslated
+            try:
+                first = next(users, None)
+            except Exception as e:
+                if not is_user_store_outage(e):
+                    raise
+                raise RepositoryUnavailableError(str(e) or type(e).__name__) from e
+            users = itertools.chain([first] if first else [], users)
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
+
+    rows = (row for user in users for row in child_rows(user))
+    encode = encode_csv if export_format == 'csv' else encode_ndjson
+    filename = f"buddysign-children-{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+    logger.info("Streaming %s children export (%s) for user %s", export_format, scope, current_user_id)
+
+    # Later pages are read as the client downloads; a failure part-way
+    # through aborts the connection instead of ending the file cleanly.
+    return Response(
+        stream_with_context(chunked(encode(rows))),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+        },
+    )
@@ -1,25 +1,65 @@
-"""Firebase client utilities for BuddySign backend."""
+"""Firebase client utilities for BuddySign backend.
+
+The Firebase SDK (``firebase_admin`` and, through it, grpc and the
+google-cloud packages) is imported on first repository use rather than at
+import time, so processes that never touch Firestore, or have not needed it
+yet, start without paying for it.
+"""
 from __future__ import annotations
 
 import json
 import logging
 import os
+import sys
 import threading
-from typing import Any, Dict, Optional
-
-import firebase_admin
-from firebase_admin import credentials, firestore
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional
+
+from instrumentation import instrumented
+from progress_counters import derived_points
+from resilience import (
+    AsyncGuardedUserRepository,
+    CircuitBreaker,
+    GuardedUserRepository,
+    call_timeout,
+    create_circuit_breaker,
+)
+from settings import env_bool, env_float, env_int, env_str
+from user_cache import AsyncCachingUserRepository, CachingUserRepository, UserCache
+
+if TYPE_CHECKING:
+    import firebase_admin
+    from firebase_admin import firestore
 
 logger = logging.getLogger(__name__)
 
 
+# Firestore rejects batched writes with more than 500 operations.
+MAX_BATCH_WRITES = 500
+
+# Documents requested per multi-get (BatchGetDocuments) call.
+MAX_BATCH_READS = 100
+
+# Firestore limits ``in`` filters to 30 values.
+MAX_IN_QUERY_VALUES = 30
+
+
 class FirebaseNotConfiguredError(RuntimeError):
     """Raised when Firebase credentials are not configured."""
 
 
+class UserAlreadyExistsError(RuntimeError):
+    """Raised by ``create_user`` when a user with the email already exists."""
+
+
 _initialise_lock = threading.Lock()
 _firestore_client: Optional[firestore.Client] = None
-_user_repository: Optional["FirestoreUserRepository"] = None
+_user_repository: Optional[Any] = None
+_async_firestore_client: Optional[Any] = None
+_async_user_repository: Optional[Any] = None
+_user_cache: Optional[UserCache] = None
+_circuit_breaker: Optional[CircuitBreaker] = None
+_email_filter_service: Optional[Any] = None
 
 
 def _build_service_account_dict() -> Optional[Dict[str, Any]]:
@@ -81,6 +121,12 @@ def _build_service_account_dict() -> Optional[Dict[str, Any]]:
 def _initialise_app() -> firebase_admin.App:
     """Initialise the firebase_admin application if needed."""
     with _initialise_lock:
+        try:
+            import firebase_admin
+            from firebase_admin import credentials
+        except ImportError as exc:
+            raise FirebaseNotConfiguredError("firebase-admin is not installed") from exc
+
         if firebase_admin._apps:
             return firebase_admin.get_app()
 
@@ -114,6 +160,8 @@ def get_firestore_client() -> firestore.Client:
         return _firestore_client
 
     app = _initialise_app()
+    from firebase_admin import firestore
+
     database_id = os.getenv("FIRESTORE_DATABASE_ID", "(default)") or "(default)"
 
     if database_id != "(default)":
@@ -134,11 +182,154 @@ def get_firestore_client() -> firestore.Client:
     return _firestore_client
 
 
+def get_async_firestore_client() -> Any:
+    """Return a singleton Firestore ``AsyncClient`` for the ASGI serving mode."""
+    global _async_firestore_client
+
+    if _async_firestore_client is not None:
+        return _async_firestore_client
+
+    app = _initialise_app()
+    from firebase_admin import firestore_async
+
+    database_id = os.getenv("FIRESTORE_DATABASE_ID", "(default)") or "(default)"
+
+    try:
+        if database_id != "(default)":
+            _async_firestore_client = firestore_async.client(app=app, database=database_id)
+        else:
+            _async_firestore_client = firestore_async.client(app=app)
+    except TypeError:
+        _async_firestore_client = firestore_async.client(app=app)
+    return _async_firestore_client
+
+
+def reset_firestore_clients() -> None:
+    """Forget clients and repositories inherited from a parent process.
+
+    gRPC channels must not be used across ``fork()``. Call this in a freshly
+    forked worker (gunicorn's ``post_fork``) so the worker creates its own
+    channel on first use. The firebase_admin app is dropped too, because it
+    caches the Firestore client it created.
+    """
+    global _firestore_client, _user_repository, _async_firestore_client
+    global _async_user_repository, _user_cache, _circuit_breaker, _email_filter_service
+
+    with _initialise_lock:
+        _firestore_client = None
+        _user_repository = None
+        _async_firestore_client = None
+        _async_user_repository = None
+        _user_cache = None
+        _circuit_breaker = None
+        _email_filter_service = None
+        firebase_admin = sys.modules.get("firebase_admin")
+        if firebase_admin is not None:
+            firebase_admin._apps.clear()
+
+
+def warm_up_firestore() -> bool:
+    """Create this process's Firestore client and open its channel.
+
+    Returns False when Firebase is not configured or not the user store.
+    """
+    if user_store_backend() != "firestore":
+        return False
+    try:
+        client = get_firestore_client()
+    except FirebaseNotConfiguredError:
+        return False
+    # Any RPC establishes the channel; reading a missing document is the cheapest.
+    client.collection("users").document("__warmup__").get()
+    return True
+
+
+def _call_timeout_seconds() -> float:
+    return env_float("FIRESTORE_CALL_TIMEOUT_SECONDS", 10.0)
+
+
+def is_firestore_outage(exc: BaseException) -> bool:
+    """True for errors that mean Firestore is unavailable rather than the request being bad."""
+    from google.api_core import exceptions
+
+    return isinstance(exc, (
+        exceptions.DeadlineExceeded,
+        exceptions.ServiceUnavailable,
+        exceptions.InternalServerError,
+        exceptions.ResourceExhausted,
+        exceptions.RetryError,
+        TimeoutError,
+        ConnectionError,
+    ))
+
+
+def _with_id_field(fields: Optional[List[str]]) -> Optional[List[str]]:
+    """Add ``id`` to a field mask; id lookups compare it against the index."""
+    if fields and "id" not in fields:
+        return [*fields, "id"]
+    return fields
+
+
+def _id_index_collection_name() -> str:
+    return os.getenv("FIRESTORE_ID_INDEX_COLLECTION", "user_ids") or "user_ids"
+
+
+class _EmailsById:
+    """Bounded LRU of user id -> email, the mapping the id index stores.
+
+    A user's id and email never change, so once an id has been resolved its
+    lookups read the user document directly: one point get instead of an
+    index read followed by the user read. An entry that no longer matches
+    (a deleted and re-created account) is dropped and the index consulted.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._emails: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[str]:
+        with self._lock:
+            email = self._emails.get(user_id)
+            if email is not None:
+                self._emails.move_to_end(user_id)
+            return email
+
+    def put(self, user_id: str, email: str) -> None:
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._emails[user_id] = email
+            self._emails.move_to_end(user_id)
+            while len(self._emails) > self._max_size:
+                self._emails.popitem(last=False)
+
+    def discard(self, user_id: str) -> None:
+        with self._lock:
+            self._emails.pop(user_id, None)
+
+
+def _emails_by_id() -> _EmailsById:
+    return _EmailsById(env_int("FIRESTORE_ID_EMAIL_CACHE_SIZE", 100000))
+
+
 class FirestoreUserRepository:
-    """Repository helper for reading/writing user data in Firestore."""
+    """Repository helper for reading/writing user data in Firestore.
+
+    User documents are keyed by email. A secondary ``user_ids`` collection maps
+    each user id to its email so id lookups are point reads instead of queries.
+    """
 
     def __init__(self, client: firestore.Client):
+        self._client = client
         self._collection = client.collection("users")
+        self._id_index = client.collection(_id_index_collection_name())
+        self._call_timeout = _call_timeout_seconds()
+        self._emails_by_id = _emails_by_id()
+
+    def _timeout(self) -> float:
+        """Per-call timeout, capped by the current request's deadline budget."""
+        return call_timeout(self._call_timeout)
 
     @staticmethod
     def _doc_to_user(doc: firestore.DocumentSnapshot) -> Dict[str, Any]:
@@ -146,32 +337,436 @@ class FirestoreUserRepository:
         data["email"] = doc.id
         return data
 
-    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        doc = self._collection.document(email).get()
+    @instrumented("firestore.get_user_by_email")
+    def get_user_by_email(self, email: str,
+                          fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Read a user; pass ``fields`` to read only those fields (a field mask)."""
+        doc = self._collection.document(email).get(field_paths=fields, timeout=self._timeout())
         if doc.exists:
             return self._doc_to_user(doc)
         return None
 
-    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+    @instrumented("firestore.get_user_by_id")
+    def get_user_by_id(self, user_id: str,
+                       fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Read a user by id; pass ``fields`` to read only those fields.
+
+        The first lookup of an id reads the index entry and then the user
+        document; later ones go straight to the user document.
+        """
+        user_id = str(user_id)
+        fields = _with_id_field(fields)
+        email = self._emails_by_id.get(user_id)
+        if email:
+            user = self.get_user_by_email(email, fields)
+            if user and str(user.get("id")) == user_id:
+                return user
+            self._emails_by_id.discard(user_id)
+        index_doc = self._id_index.document(user_id).get(timeout=self._timeout())
+        if index_doc.exists:
+            email = (index_doc.to_dict() or {}).get("email")
+            user = self.get_user_by_email(email, fields) if email else None
+            if user and str(user.get("id")) == user_id:
+                self._emails_by_id.put(user_id, email)
+                return user
+
+        # Users created before the index existed are not indexed yet; fall back
+        # to the query once and repair the index entry for next time.
         query = self._collection.where("id", "==", user_id).limit(1)
-        for doc in query.stream():
+        if fields:
+            query = query.select(fields)
+        for doc in query.stream(timeout=self._timeout()):
+            self._id_index.document(user_id).set({"email": doc.id}, timeout=self._timeout())
+            logger.info("Repaired id index entry for user %s", user_id)
+            self._emails_by_id.put(user_id, doc.id)
             return self._doc_to_user(doc)
         return None
 
+    def _get_all(self, refs: List[Any]) -> Iterator[firestore.DocumentSnapshot]:
+        for start in range(0, len(refs), MAX_BATCH_READS):
+            yield from self._client.get_all(
+                refs[start:start + MAX_BATCH_READS], timeout=self._timeout()
+            )
+
+    @instrumented("firestore.get_users_by_emails")
+    def get_users_by_emails(self, emails: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch many users with multi-gets; returns ``{email: user}`` for those found."""
+        refs = [self._collection.document(email) for email in dict.fromkeys(emails)]
+        return {
+            doc.id: self._doc_to_user(doc)
+            for doc in self._get_all(refs)
+            if doc.exists
+        }
+
+    @instrumented("firestore.get_users_by_ids")
+    def get_users_by_ids(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch many users by id; returns ``{user_id: user}`` for those found.
+
+        Resolves ids through the id index with one multi-get, then fetches the
+        user documents with another. Ids missing from the index are looked up
+        with ``in`` queries and their index entries repaired.
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        emails_by_id: Dict[str, str] = {}
+        for doc in self._get_all([self._id_index.document(user_id) for user_id in user_ids]):
+            email = (doc.to_dict() or {}).get("email") if doc.exists else None
+            if email:
+                emails_by_id[doc.id] = email
+
+        users: Dict[str, Dict[str, Any]] = {}
+        for user in self.get_users_by_emails(emails_by_id.values()).values():
+            user_id = str(user.get("id"))
+            if emails_by_id.get(user_id) == user["email"]:
+                users[user_id] = user
+
+        unresolved = [user_id for user_id in user_ids if user_id not in users]
+        for start in range(0, len(unresolved), MAX_IN_QUERY_VALUES):
+            chunk = unresolved[start:start + MAX_IN_QUERY_VALUES]
+            for doc in self._collection.where("id", "in", chunk).stream(timeout=self._timeout()):
+                user = self._doc_to_user(doc)
+                users[str(user["id"])] = user
+                self._id_index.document(str(user["id"])).set({"email": doc.id}, timeout=self._timeout())
+                logger.info("Repaired id index entry for user %s", user["id"])
+        return users
+
+    @instrumented("firestore.create_user")
     def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        self._collection.document(email).set(data)
+        """Create the user document and its id index entry in one atomic batch.
+
+        The user document is written with ``create``, so the commit fails
+        with :class:`UserAlreadyExistsError` instead of overwriting an
+        existing account.
+        """
+        from google.api_core.exceptions import AlreadyExists
+
+        batch = self._client.batch()
+        batch.create(self._collection.document(email), data)
+        if data.get("id") is not None:
+            batch.set(self._id_index.document(str(data["id"])), {"email": email})
+        try:
+            batch.commit(timeout=self._timeout())
+        except AlreadyExists as exc:
+            raise UserAlreadyExistsError(email) from exc
+        if data.get("id") is not None:
+            self._emails_by_id.put(str(data["id"]), email)
         return data
 
+    @instrumented("firestore.update_user")
     def update_user(self, email: str, updates: Dict[str, Any]) -> None:
-        self._collection.document(email).update(updates)
+        self._collection.document(email).update(updates, timeout=self._timeout())
+
+    @instrumented("firestore.increment_child_progress")
+    def increment_child_progress(self, email: str, child_id: str,
+                                 increments: Dict[str, int], backfill_points: bool = False) -> None:
+        """Atomically add ``increments`` to a child's counters in one update.
+
+        ``points`` is also added to the parent's total and ``profile_version``
+        is bumped, all in the same write. With ``backfill_points`` (an older
+        record without a stored total) the document is read and written in a
+        transaction, so the total derived from the children and the increment
+        land together even if another update races it.
+        """
+        from firebase_admin import firestore
+
+        updates: Dict[str, Any] = {
+            firestore.FieldPath("child_progress", str(child_id), counter).to_api_repr():
+                firestore.Increment(amount)
+            for counter, amount in increments.items()
+        }
+        if increments.get("points"):
+            updates["points"] = firestore.Increment(increments["points"])
+        updates["profile_version"] = firestore.Increment(1)
+        document = self._collection.document(email)
+        if not backfill_points:
+            document.update(updates, timeout=self._timeout())
+            return
+
+        @firestore.transactional
+        def backfill(transaction):
+            # A missing document fails the update at commit, as it does above
+            user = document.get(transaction=transaction, timeout=self._timeout()).to_dict() or {}
+            if user.get("points") is None:
+                updates["points"] = derived_points(user) + increments.get("points", 0)
+            transaction.update(document, updates)
+
+        backfill(self._client.transaction())
+
+    @instrumented("firestore.batch_update")
+    def batch_update(self, updates_by_email: Dict[str, Dict[str, Any]]) -> None:
+        """Apply field updates to many users with batched writes."""
+        items = list(updates_by_email.items())
+        for start in range(0, len(items), MAX_BATCH_WRITES):
+            batch = self._client.batch()
+            for email, updates in items[start:start + MAX_BATCH_WRITES]:
+                batch.update(self._collection.document(email), updates)
+            batch.commit(timeout=self._timeout())
+
+    @instrumented("firestore.append_events")
+    def append_events(self, events_by_email: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Store events in each user's ``events`` subcollection with batched writes."""
+        refs_and_events = [
+            (self._collection.document(email).collection("events").document(), event)
+            for email, events in events_by_email.items()
+            for event in events
+        ]
+        for start in range(0, len(refs_and_events), MAX_BATCH_WRITES):
+            batch = self._client.batch()
+            for ref, event in refs_and_events[start:start + MAX_BATCH_WRITES]:
+                batch.set(ref, event)
+            batch.commit(timeout=self._timeout())
+
+    def iter_users(self, page_size: int = 500,
+                   fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield every user, reading ``page_size`` documents per query.
+
+        Pages are ordered by document id and resumed with a cursor, so a full
+        scan never holds more than one page in memory. Pass ``fields`` to
+        read only those fields.
+        """
+        from firebase_admin import firestore
+
+        query = self._collection.order_by(firestore.FieldPath.document_id()).limit(page_size)
+        if fields:
+            query = query.select(fields)
+        last_doc = None
+        while True:
+            page = query.start_after(last_doc) if last_doc is not None else query
+            docs = list(page.stream(timeout=self._timeout()))
+            for doc in docs:
+                yield self._doc_to_user(doc)
+            if len(docs) < page_size:
+                return
+            last_doc = docs[-1]
+
+    def backfill_id_index(self, batch_size: int = 400) -> int:
+        """Write id index entries for every existing user; returns the count."""
+        written = 0
+        batch = self._client.batch()
+        pending = 0
+        for doc in self._collection.select(["id"]).stream():
+            user_id = (doc.to_dict() or {}).get("id")
+            if user_id is None:
+                continue
+            batch.set(self._id_index.document(str(user_id)), {"email": doc.id})
+            pending += 1
+            if pending >= batch_size:
+                batch.commit()
+                written += pending
+                batch = self._client.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+            written += pending
+        return written
+
+
+class AsyncFirestoreUserRepository:
+    """Async counterpart of :class:`FirestoreUserRepository` built on ``AsyncClient``."""
+
+    def __init__(self, client: Any):
+        self._client = client
+        self._collection = client.collection("users")
+        self._id_index = client.collection(_id_index_collection_name())
+        self._call_timeout = _call_timeout_seconds()
+        self._emails_by_id = _emails_by_id()
+
+    def _timeout(self) -> float:
+        return call_timeout(self._call_timeout)
+
+    @instrumented("firestore_async.get_user_by_email")
+    async def get_user_by_email(self, email: str,
+                                fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        doc = await self._collection.document(email).get(
+            field_paths=fields, timeout=self._timeout()
+        )
+        if doc.exists:
+            return FirestoreUserRepository._doc_to_user(doc)
+        return None
+
+    @instrumented("firestore_async.get_user_by_id")
+    async def get_user_by_id(self, user_id: str,
+                             fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        user_id = str(user_id)
+        fields = _with_id_field(fields)
+        email = self._emails_by_id.get(user_id)
+        if email:
+            user = await self.get_user_by_email(email, fields)
+            if user and str(user.get("id")) == user_id:
+                return user
+            self._emails_by_id.discard(user_id)
+        index_doc = await self._id_index.document(user_id).get(timeout=self._timeout())
+        if index_doc.exists:
+            email = (index_doc.to_dict() or {}).get("email")
+            user = await self.get_user_by_email(email, fields) if email else None
+            if user and str(user.get("id")) == user_id:
+                self._emails_by_id.put(user_id, email)
+                return user
+
+        query = self._collection.where("id", "==", user_id).limit(1)
+        if fields:
+            query = query.select(fields)
+        async for doc in query.stream(timeout=self._timeout()):
+            await self._id_index.document(user_id).set({"email": doc.id}, timeout=self._timeout())
+            logger.info("Repaired id index entry for user %s", user_id)
+            self._emails_by_id.put(user_id, doc.id)
+            return FirestoreUserRepository._doc_to_user(doc)
+        return None
+
+    @instrumented("firestore_async.create_user")
+    async def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        from google.api_core.exceptions import AlreadyExists
+
+        batch = self._client.batch()
+        batch.create(self._collection.document(email), data)
+        if data.get("id") is not None:
+            batch.set(self._id_index.document(str(data["id"])), {"email": email})
+        try:
+            await batch.commit(timeout=self._timeout())
+        except AlreadyExists as exc:
+            raise UserAlreadyExistsError(email) from exc
+        if data.get("id") is not None:
+            self._emails_by_id.put(str(data["id"]), email)
+        return data
+
+    @instrumented("firestore_async.update_user")
+    async def update_user(self, email: str, updates: Dict[str, Any]) -> None:
+        await self._collection.document(email).update(updates, timeout=self._timeout())
+
+    @instrumented("firestore_async.batch_update")
+    async def batch_update(self, updates_by_email: Dict[str, Dict[str, Any]]) -> None:
+        items = list(updates_by_email.items())
+        for start in range(0, len(items), MAX_BATCH_WRITES):
+            batch = self._client.batch()
+            for email, updates in items[start:start + MAX_BATCH_WRITES]:
+                batch.update(self._collection.document(email), updates)
+            await batch.commit(timeout=self._timeout())
 
 
-def get_user_repository() -> FirestoreUserRepository:
-    """Return a singleton user repository."""
+def get_user_cache() -> Optional[UserCache]:
+    """Return the process-wide user cache, or None if ``USER_CACHE_ENABLED`` is false.
+
+    ``USER_CACHE_MAX_SIZE`` and ``USER_CACHE_TTL_SECONDS`` bound the cache;
+    ``USER_CACHE_STALE_SECONDS`` is how long past the TTL an entry may still
+    be served while the user store is unavailable. The sync and async
+    repositories share it.
+    """
+    global _user_cache
+
+    if _user_cache is None and env_bool("USER_CACHE_ENABLED", True):
+        _user_cache = UserCache(
+            max_size=env_int("USER_CACHE_MAX_SIZE", 1024),
+            ttl_seconds=env_float("USER_CACHE_TTL_SECONDS", 60.0),
+            stale_seconds=env_float("USER_CACHE_STALE_SECONDS", 300.0),
+        )
+    return _user_cache
+
+
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    """Return the process-wide user store breaker, or None if ``CIRCUIT_BREAKER_ENABLED`` is false.
+
+    The sync and async repositories share it.
+    """
+    global _circuit_breaker
+
+    if _circuit_breaker is None:
+        _circuit_breaker = create_circuit_breaker("user_store")
+    return _circuit_breaker
+
+
+def get_email_filter_service(repository: Any = None) -> Optional[Any]:
+    """Return the process-wide email filter service, or None if ``EMAIL_FILTER_ENABLED`` is false.
+
+    ``repository`` is the repository scanned to build the filter; it is
+    required on the first call. The sync and async repositories share it.
+    """
+    global _email_filter_service
+
+    if _email_filter_service is None and repository is not None:
+        from email_filter import create_email_filter_service, email_filter_enabled
+
+        if email_filter_enabled():
+            _email_filter_service = create_email_filter_service(repository)
+    return _email_filter_service
+
+
+def user_store_backend() -> str:
+    """Return the ``USER_STORE_BACKEND`` setting: firestore, sqlite or memory."""
+    return (env_str("USER_STORE_BACKEND", "firestore") or "firestore").lower()
+
+
+def is_user_store_outage(exc: BaseException) -> bool:
+    """``is_firestore_outage`` or ``is_sqlite_outage``, for the configured backend.
+
+    For unguarded calls such as ``iter_users``, whose errors reach the caller
+    untranslated.
+    """
+    if user_store_backend() == "sqlite":
+        from sqlite_repository import is_sqlite_outage
+
+        return is_sqlite_outage(exc)
+    if user_store_backend() == "firestore":
+        return is_firestore_outage(exc)
+    return False
+
+
+def get_user_repository() -> Any:
+    """Return a singleton user repository, wrapped by the user cache if enabled.
+
+    ``USER_STORE_BACKEND`` selects Firestore (default) or the SQLite file at
+    ``USER_STORE_PATH``. Calls go through the circuit breaker when it is
+    enabled, and email lookups through the email filter when that is.
+    """
     global _user_repository
 
     if _user_repository is None:
-        client = get_firestore_client()
-        _user_repository = FirestoreUserRepository(client)
-
-    return _user_repository
\ No newline at end of file
+        backend = user_store_backend()
+        repository: Any
+        if backend == "firestore":
+            repository = FirestoreUserRepository(get_firestore_client())
+            is_outage = is_firestore_outage
+        elif backend == "sqlite":
+            from sqlite_repository import create_sqlite_user_repository, is_sqlite_outage
+
+            repository = create_sqlite_user_repository()
+            is_outage = is_sqlite_outage
+        else:
+            raise ValueError(f"Unknown USER_STORE_BACKEND '{backend}'")
+        breaker = get_circuit_breaker()
+        if breaker is not None:
+            repository = GuardedUserRepository(repository, breaker, is_outage)
+        cache = get_user_cache()
+        if cache is not None:
+            repository = CachingUserRepository(repository, cache)
+        email_filter_service = get_email_filter_service(repository)
+        if email_filter_service is not None:
+            from email_filter import EmailFilteredUserRepository
+
+            repository = EmailFilteredUserRepository(repository, email_filter_service)
+        _user_repository = repository
+
+    return _user_repository
+
+
+def get_async_user_repository() -> Any:
+    """Return a singleton async user repository, sharing the sync user cache."""
+    global _async_user_repository
+
+    if user_store_backend() != "firestore":
+        raise FirebaseNotConfiguredError("USER_STORE_BACKEND is not firestore")
+    if _async_user_repository is None:
+        repository: Any = AsyncFirestoreUserRepository(get_async_firestore_client())
+        breaker = get_circuit_breaker()
+        if breaker is not None:
+            repository = AsyncGuardedUserRepository(repository, breaker, is_firestore_outage)
+        cache = get_user_cache()
+        if cache is not None:
+            repository = AsyncCachingUserRepository(repository, cache)
+        # Built from the sync repository, which the async one mirrors.
+        email_filter_service = get_email_filter_service(get_user_repository())
+        if email_filter_service is not None:
+            from email_filter import AsyncEmailFilteredUserRepository
+
+            repository = AsyncEmailFilteredUserRepository(repository, email_filter_service)
+        _async_user_repository = repository
+
+    return _async_user_repository
@@ -0,0 +1,65 @@
+"""Gunicorn settings for running BuddySign with several preloaded workers.
+
+    gunicorn -c gunicorn.conf.py
+
+With ``preload_app`` the application is imported once in the master and
+shared copy-on-write with the workers. Firestore's gRPC channels are not
+fork-safe, so ``post_fork`` drops any client the master created and each
+worker builds its own. ``post_worker_init`` then opens that channel before
+the worker accepts connections, so the first request doesn't pay for it.
+For the same reason the master does not load the leaderboard; each worker
+starts its own background load in ``post_fork``.
+"""
+import logging
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from settings import env_bool, env_int, env_str  # noqa: E402
+
+wsgi_app = 'app:app'
+bind = env_str('GUNICORN_BIND') or f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5000')}"
+workers = env_int('WEB_CONCURRENCY', multiprocessing.cpu_count())
+worker_class = 'gthread'
+threads = env_int('GUNICORN_THREADS', 8)
+preload_app = env_bool('GUNICORN_PRELOAD', True)
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 0)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 0)
+
+load_leaderboard = env_bool('LEADERBOARD_LOAD_ON_START', True)
+if preload_app:
+    # Keep the preloading master from scanning Firestore before it forks.
+    os.environ['LEADERBOARD_LOAD_ON_START'] = 'false'
+
+logger = logging.getLogger('gunicorn.error')
+
+
+def post_fork(server, worker):
+    from auth import reset_after_fork
+    from leaderboard import leaderboard_service
+
+    reset_after_fork()
+    leaderboard_service.reset_after_fork()
+    if load_leaderboard and not leaderboard_service.loaded:
+        leaderboard_service.start_loading()
+
+
+def post_worker_init(worker):
+    if not env_bool('FIRESTORE_WARMUP', True):
+        return
+    from auth import get_firestore_repo
+    from firebase_client import warm_up_firestore
+
+    try:
+        if warm_up_firestore():
+            get_firestore_repo()
+            logger.info("Worker %s: Firestore channel ready", worker.pid)
+    except Exception:
+        # Serve anyway; the first request will retry the connection.
+        logger.warning("Worker %s: Firestore warm-up failed", worker.pid, exc_info=True)
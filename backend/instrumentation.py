@@ -0,0 +1,249 @@
+"""Per-request phase timing, ``Server-Timing`` headers and Prometheus metrics.
+
+Hot spots (repository calls, password hashing, JWT creation, JSON encoding)
+are wrapped in :func:`timed` blocks or the :func:`instrumented` decorator.
+Each block records its duration into a histogram and, when
+``SERVER_TIMING_ENABLED`` is set, into the current request so it can be
+reported in a ``Server-Timing`` response header. Histograms are rendered in
+the Prometheus text format by the ``/metrics`` endpoint when
+``METRICS_ENABLED`` is set.
+
+Both settings default to off. With both off, :func:`timed` returns a shared
+no-op context manager, so instrumented code pays one function call and a
+flag check.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Flask, g, has_request_context, request
+
+from json_provider import FastJSONProvider
+from settings import env_bool
+
+# Upper bounds in seconds, Prometheus-style.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_metrics_enabled = False
+_server_timing_enabled = False
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a lock per instance."""
+
+    __slots__ = ("_buckets", "_counts", "_sum", "_count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+
+class MetricsRegistry:
+    """Named histograms keyed by label values, plus gauge collectors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(value)
+
+    def register_collector(self, collector: Callable[[], Dict[str, float]]) -> None:
+        """Register a callable returning ``{metric_name: value}`` gauges."""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+        current = None
+        for (name, labels), histogram in items:
+            if name != current:
+                current = name
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+            counts, total, count = histogram.snapshot()
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(histogram._buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{name}_sum{suffix} {total}")
+            lines.append(f"{name}_count{suffix} {count}")
+        for collector in self._collectors:
+            for metric, value in sorted(collector().items()):
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
+registry.describe("buddysign_phase_duration_seconds", "Time spent in instrumented request phases")
+registry.describe("buddysign_request_duration_seconds", "End-to-end request handling time")
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _PhaseTimer:
+    __slots__ = ("_name", "_started")
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self._started
+        if _metrics_enabled:
+            registry.observe("buddysign_phase_duration_seconds", elapsed, phase=self._name)
+        if _server_timing_enabled and has_request_context():
+            phases = g.setdefault("_server_timing", {})
+            phases[self._name] = phases.get(self._name, 0.0) + elapsed
+        return False
+
+
+def timed(name: str):
+    """Context manager timing one phase of the current request."""
+    if not (_metrics_enabled or _server_timing_enabled):
+        return _NULL_TIMER
+    return _PhaseTimer(name)
+
+
+def instrumented(name: str):
+    """Decorator form of :func:`timed`."""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TimedJSONProvider(FastJSONProvider):
+    """JSON provider that records serialization time as a phase."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        with timed("json.dumps"):
+            return super().dumps(obj, **kwargs)
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        with timed("json.dumps"):
+            return super().dumps_bytes(obj)
+
+
+def record_request(endpoint: str, method: str, status: int, elapsed: float) -> None:
+    """Record one handled request in the request-duration histogram."""
+    if _metrics_enabled:
+        registry.observe(
+            "buddysign_request_duration_seconds",
+            elapsed,
+            endpoint=endpoint,
+            method=method,
+            status=str(status),
+        )
+
+
+def _server_timing_header(phases: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items())
+
+
+def init_instrumentation(app: Flask, metrics: Optional[bool] = None,
+                         server_timing: Optional[bool] = None) -> None:
+    """Enable instrumentation for ``app`` according to the environment."""
+    global _metrics_enabled, _server_timing_enabled
+
+    _metrics_enabled = env_bool("METRICS_ENABLED", False) if metrics is None else metrics
+    _server_timing_enabled = (
+        env_bool("SERVER_TIMING_ENABLED", False) if server_timing is None else server_timing
+    )
+    if not (_metrics_enabled or _server_timing_enabled):
+        return
+
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def _start_request_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_timer(response):
+        started = g.pop("_request_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        record_request(request.endpoint or "unmatched", request.method,
+                       response.status_code, elapsed)
+        if _server_timing_enabled:
+            phases = g.get("_server_timing") or {}
+            phases["total"] = elapsed
+            response.headers["Server-Timing"] = _server_timing_header(phases)
+        return response
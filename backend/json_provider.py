@@ -0,0 +1,105 @@
+"""Fast JSON serialization for Flask responses.
+
+:class:`FastJSONProvider` encodes with ``orjson`` when it is installed and
+falls back to Flask's stdlib-based provider otherwise (or when
+``JSON_PROVIDER=stdlib``). Output matches Flask's defaults: sorted keys,
+compact outside debug mode, datetimes as HTTP dates and a trailing newline
+on responses. orjson writes UTF-8 rather than ``\\uXXXX`` escapes, which is
+the same JSON.
+
+:class:`PreparedJSON` serializes a constant payload once so handlers for
+health checks, API info and error bodies only copy bytes per request.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Optional
+
+from flask import Flask, Response
+from flask.json.provider import DefaultJSONProvider
+
+from settings import env_str
+
+logger = logging.getLogger(__name__)
+
+
+def _load_orjson() -> Optional[Any]:
+    choice = (env_str("JSON_PROVIDER", "auto") or "auto").lower()
+    if choice == "stdlib":
+        return None
+    try:
+        import orjson
+    except ImportError:
+        if choice == "orjson":
+            logger.warning("JSON_PROVIDER=orjson but orjson is not installed; using stdlib json")
+        return None
+    return orjson
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, with a stdlib fallback."""
+
+    def __init__(self, app: Flask):
+        super().__init__(app)
+        self._orjson = _load_orjson()
+
+    @property
+    def backend(self) -> str:
+        return "orjson" if self._orjson is not None else "stdlib"
+
+    def _pretty(self) -> bool:
+        return (self.compact is None and self._app.debug) or self.compact is False
+
+    def _orjson_options(self, pretty: bool = False) -> int:
+        orjson = self._orjson
+        # Datetimes go through Flask's default hook so they stay HTTP dates.
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if pretty:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if self._orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode()
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        """Serialize a response body, including the newline ``jsonify`` appends."""
+        pretty = self._pretty()
+        if self._orjson is None:
+            dump_args = {"indent": 2} if pretty else {"separators": (",", ":")}
+            return f"{super().dumps(obj, **dump_args)}\n".encode()
+        options = self._orjson_options(pretty) | self._orjson.OPT_APPEND_NEWLINE
+        return self._orjson.dumps(obj, default=self.default, option=options)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+class PreparedJSON:
+    """A JSON response body serialized once at startup.
+
+    Each call returns a fresh response, so per-request header changes (CORS,
+    timing) never leak between requests. Put :attr:`SLOT` in the payload for
+    one value that changes per request, such as a timestamp, and pass that
+    value to the call.
+    """
+
+    SLOT = "__prepared_json_slot__"
+
+    def __init__(self, app: Flask, payload: Any, status: int = 200):
+        self._app = app
+        self._status = status
+        body = app.json.dumps_bytes(payload)
+        marker = app.json.dumps_bytes(self.SLOT).rstrip()
+        self._head, found, self._tail = body.partition(marker)
+        self._has_slot = bool(found)
+
+    def __call__(self, value: Any = None) -> Response:
+        body = self._head
+        if self._has_slot:
+            body = b"".join((self._head, self._app.json.dumps_bytes(value).rstrip(), self._tail))
+        return self._app.response_class(body, status=self._status, mimetype=self._app.json.mimetype)
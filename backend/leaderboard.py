@@ -0,0 +1,118 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+import logging
+import math
+
+from auth import get_firestore_repo, repository_unavailable_response, users_db
+from ranking import LeaderboardLoadingError, child_entries, leaderboard_service
+from resilience import RepositoryUnavailableError
+from settings import env_bool, env_int
+
+logger = logging.getLogger(__name__)
+
+# Create leaderboard blueprint
+leaderboard_bp = Blueprint('leaderboard', __name__)
+
+# Only the fields child_entries reads are fetched during a rebuild
+LEADERBOARD_FIELDS = ['id', 'children', 'child_progress']
+
+
+def load_leaderboard_entries():
+    """Yield an entry for every child in the repository (or local store)."""
+    repo = get_firestore_repo()
+    users = repo.iter_users(fields=LEADERBOARD_FIELDS) if repo else list(users_db.values())
+    for user in users:
+        yield from child_entries(user)
+
+
+leaderboard_service.loader = load_leaderboard_entries
+
+
+def start_leaderboard_load():
+    """Start loading the board in the background (``LEADERBOARD_LOAD_ON_START``)."""
+    if env_bool('LEADERBOARD_LOAD_ON_START', True) and not leaderboard_service.loaded:
+        leaderboard_service.start_loading()
+
+
+def leaderboard_loading_response(exc):
+    """503 returned until the board's first load has finished."""
+    return jsonify({
+        'success': False,
+        'message': 'Leaderboard is loading, please try again shortly',
+        'error': 'leaderboard_loading'
+    }), 503, {'Retry-After': str(max(1, math.ceil(exc.retry_after)))}
+
+
+def _int_arg(name, default, minimum, maximum):
+    try:
+        value = int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(minimum, min(value, maximum))
+
+
+@leaderboard_bp.route('', methods=['GET', 'OPTIONS'])
+@jwt_required()
+def top_children():
+    """Top children by points, paged with ?limit= and ?offset="""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        leaderboard_service.ensure_loaded()
+        limit = _int_arg('limit', 10, 1, env_int('LEADERBOARD_MAX_LIMIT', 100))
+        offset = _int_arg('offset', 0, 0, len(leaderboard_service.board))
+        return jsonify({
+            'success': True,
+            'data': {
+                'entries': leaderboard_service.board.top(limit, offset),
+                'total': len(leaderboard_service.board)
+            }
+        }), 200
+
+    except LeaderboardLoadingError as e:
+        return leaderboard_loading_response(e)
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
+    except Exception as e:
+        logger.exception("Leaderboard fetch failed")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to fetch leaderboard',
+            'error': str(e)
+        }), 500
+
+
+@leaderboard_bp.route('/children/<child_id>', methods=['GET', 'OPTIONS'])
+@jwt_required()
+def child_rank(child_id):
+    """Rank of one child on the leaderboard"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        leaderboard_service.ensure_loaded()
+        entry = leaderboard_service.board.rank(child_id)
+        if entry is None:
+            return jsonify({
+                'success': False,
+                'message': 'Child not found on the leaderboard',
+                'error': 'child_not_found'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'data': entry
+        }), 200
+
+    except LeaderboardLoadingError as e:
+        return leaderboard_loading_response(e)
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
+    except Exception as e:
+        logger.exception("Leaderboard rank lookup failed")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to fetch leaderboard rank',
+            'error': str(e)
+        }), 500
@@ -0,0 +1,162 @@
+"""Password hashing service that keeps KDF work off the request threads.
+
+Hashes are computed with Werkzeug's ``generate_password_hash`` and
+``check_password_hash`` in a bounded process pool. A semaphore caps the number
+of queued and running jobs; when it is exhausted callers get a
+:class:`HashingOverloadedError` immediately instead of piling up behind the
+pool, which the views turn into a fast ``503``. If a pool process dies, the
+broken pool is replaced and the job retried once; a second failure is also
+reported as :class:`HashingOverloadedError`.
+
+Settings:
+
+``PASSWORD_HASH_METHOD``
+    Werkzeug method string, e.g. ``scrypt``, ``scrypt:32768:8:1`` or
+    ``pbkdf2:sha256:600000``. Stored hashes created with different parameters
+    are rehashed on the next successful login.
+``PASSWORD_HASH_WORKERS``
+    Pool size. ``0`` hashes inline on the calling thread.
+``PASSWORD_HASH_MAX_PENDING``
+    Maximum jobs queued or running before new requests are rejected.
+``PASSWORD_HASH_START_METHOD``
+    multiprocessing start method for the pool (default ``forkserver`` where
+    available, else ``spawn``).
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+from settings import env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+
+class HashingOverloadedError(RuntimeError):
+    """Raised when the hashing queue is full and the request should be shed."""
+
+
+def normalise_hash_method(method: str) -> str:
+    """Expand a Werkzeug method string to the form embedded in its hashes."""
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = map(int, args) if args else (2**15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Unsupported password hash method '{method}'")
+
+
+class PasswordHasher:
+    """Hash and verify passwords in a bounded worker pool."""
+
+    def __init__(
+        self,
+        method: str = "scrypt",
+        workers: int = 2,
+        max_pending: int = 32,
+        start_method: Optional[str] = None,
+    ):
+        self.method = normalise_hash_method(method)
+        self.workers = workers
+        self._start_method = start_method
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # A pool inherited across fork() is unusable, so rebuild it per process.
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._executor_lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    start_method = self._start_method or (
+                        "forkserver"
+                        if "forkserver" in multiprocessing.get_all_start_methods()
+                        else "spawn"
+                    )
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(start_method),
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Drop a broken pool so the next job starts a fresh one."""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloadedError("Password hashing queue is full")
+        try:
+            if self.workers <= 0:
+                return func(*args)
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    return executor.submit(func, *args).result()
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM-killed); hashing is side-effect
+                    # free, so rebuild the pool and retry once.
+                    logger.warning("Password hashing pool is broken; restarting it", exc_info=True)
+                    self._discard_executor(executor)
+            raise HashingOverloadedError("Password hashing pool keeps failing")
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Return True when ``password_hash`` was made with other KDF parameters."""
+        return password_hash.split("$", 1)[0] != self.method
+
+    def shutdown(self) -> None:
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+_password_hasher: Optional[PasswordHasher] = None
+_password_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Return the process-wide :class:`PasswordHasher` built from settings."""
+    global _password_hasher
+
+    if _password_hasher is None:
+        with _password_hasher_lock:
+            if _password_hasher is None:
+                _password_hasher = PasswordHasher(
+                    method=env_str("PASSWORD_HASH_METHOD", "scrypt"),
+                    workers=env_int("PASSWORD_HASH_WORKERS", min(2, os.cpu_count() or 1)),
+                    max_pending=env_int("PASSWORD_HASH_MAX_PENDING", 32),
+                    start_method=env_str("PASSWORD_HASH_START_METHOD"),
+                )
+                logger.info(
+                    "Password hashing uses %s with %s worker(s)",
+                    _password_hasher.method,
+                    _password_hasher.workers,
+                )
+    return _password_hasher
@@ -0,0 +1,157 @@
+"""User profile snapshots embedded in access-token claims.
+
+When ``TOKEN_PROFILE_SNAPSHOT_ENABLED`` is set, ``login`` and ``refresh``
+add a ``profile`` claim to the access token holding the user payload
+``/verify-token`` returns. Because the token is signed, ``/verify-token`` can
+answer from the claim without reading the datastore.
+
+Each snapshot records the user's ``profile_version``. Writes that change
+profile data bump that field, and :data:`profile_versions` remembers the
+newest version this process has seen; a snapshot older than that is ignored
+and the caller falls back to the repository.
+
+The tracker only sees writes made by its own process, so a snapshot is also
+trusted for at most ``TOKEN_PROFILE_SNAPSHOT_MAX_AGE_SECONDS`` after the token
+was issued. The default is the regular access-token lifetime
+(``JWT_ACCESS_TOKEN_EXPIRES``): an ordinary token uses its snapshot for as
+long as it is valid, and a long-lived "remember me" token falls back to the
+repository once it is older than that. This bounds how stale another worker's
+(or host's) answer can be without a shared read on every request.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from progress_counters import merged_children
+from settings import env_bool, env_float, env_int
+
+SNAPSHOT_CLAIM = "profile"
+# Bumped whenever the snapshot layout changes; older snapshots are ignored.
+SNAPSHOT_FORMAT = 2
+
+
+def snapshot_enabled() -> bool:
+    return env_bool("TOKEN_PROFILE_SNAPSHOT_ENABLED", False)
+
+
+class ProfileVersionTracker:
+    """Bounded map of user id -> newest ``profile_version`` seen in-process."""
+
+    def __init__(self, max_size: int = 10000):
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._versions: "OrderedDict[str, float]" = OrderedDict()
+
+    # Marks a user whose stored version has moved on to a value not read yet.
+    _STALE = float("inf")
+
+    def note(self, user_id: Any, version: Optional[int]) -> None:
+        """Record a version read from the datastore."""
+        key = str(user_id)
+        version = int(version or 0)
+        with self._lock:
+            known = self._versions.get(key, -1)
+            if known == self._STALE or known < version:
+                self._versions[key] = version
+            self._versions.move_to_end(key)
+            self._trim()
+
+    def bump(self, user_id: Any) -> None:
+        """Record that this process just changed the user's profile.
+
+        Every snapshot is treated as outdated until the new version is read
+        back and passed to :meth:`note`.
+        """
+        key = str(user_id)
+        with self._lock:
+            self._versions[key] = self._STALE
+            self._versions.move_to_end(key)
+            self._trim()
+
+    def _trim(self) -> None:
+        while len(self._versions) > self._max_size:
+            self._versions.popitem(last=False)
+
+    def is_current(self, user_id: Any, version: int) -> bool:
+        with self._lock:
+            known = self._versions.get(str(user_id))
+        return known is None or version >= known
+
+
+profile_versions = ProfileVersionTracker()
+
+
+def build_profile_claims(user_record: Dict[str, Any]) -> Dict[str, Any]:
+    """Return ``additional_claims`` for ``create_access_token``.
+
+    The snapshot holds the whole ``prepare_user_response`` payload, children
+    included, so ``/verify-token`` returns the same body either way. Returns an
+    empty dict when snapshots are disabled, or when the profile has more
+    children than ``TOKEN_PROFILE_SNAPSHOT_MAX_CHILDREN`` or encodes to more
+    than ``TOKEN_PROFILE_SNAPSHOT_MAX_BYTES`` (to keep the cookie under the
+    browser limit); such tokens simply take the repository path.
+    """
+    if not snapshot_enabled():
+        return {}
+
+    children = merged_children(user_record)
+    if len(children) > env_int("TOKEN_PROFILE_SNAPSHOT_MAX_CHILDREN", 8):
+        return {}
+
+    points = user_record.get("points")
+    if points is None:
+        points = sum(child.get("points", 0) for child in children)
+
+    user = {
+        "id": user_record["id"],
+        "name": user_record.get("name"),
+        "email": user_record.get("email"),
+        "isParent": user_record.get("isParent", True),
+        "children": children,
+        "points": points,
+    }
+    encoded = json.dumps(user, separators=(",", ":"), default=str)
+    if len(encoded.encode("utf-8")) > env_int("TOKEN_PROFILE_SNAPSHOT_MAX_BYTES", 2048):
+        return {}
+
+    return {
+        SNAPSHOT_CLAIM: {
+            "fmt": SNAPSHOT_FORMAT,
+            "v": int(user_record.get("profile_version", 0)),
+            "user": json.loads(encoded),
+        }
+    }
+
+
+def user_response_from_claims(claims: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Rebuild a ``prepare_user_response`` payload from token claims.
+
+    Returns None when there is no usable snapshot, when the token was issued
+    more than ``TOKEN_PROFILE_SNAPSHOT_MAX_AGE_SECONDS`` ago (default the
+    access-token lifetime, 0 for no limit),
+    or when this process has seen a newer profile version than the one in the
+    token.
+    """
+    if not snapshot_enabled():
+        return None
+
+    snapshot = claims.get(SNAPSHOT_CLAIM)
+    if not isinstance(snapshot, dict) or snapshot.get("fmt") != SNAPSHOT_FORMAT:
+        return None
+    user = snapshot.get("user")
+    if not isinstance(user, dict) or str(user.get("id")) != str(claims.get("sub")):
+        return None
+    max_age = env_float("TOKEN_PROFILE_SNAPSHOT_MAX_AGE_SECONDS",
+                        env_int("JWT_ACCESS_TOKEN_EXPIRES", 3600))
+    issued_at = claims.get("iat")
+    if max_age > 0 and (not isinstance(issued_at, (int, float))
+                        or time.time() - issued_at > max_age):
+        return None
+    if not profile_versions.is_current(user["id"], snapshot.get("v", 0)):
+        return None
+
+    return user
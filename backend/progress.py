@@ -0,0 +1,109 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import logging
+import threading
+
+from auth import fetch_user_by_id, get_firestore_repo, repository_unavailable_response, users_db
+from profile_snapshot import profile_versions
+from progress_counters import CHILD_COUNTERS, derived_points
+from ranking import leaderboard_service
+from resilience import RepositoryUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# Create progress blueprint
+progress_bp = Blueprint('progress', __name__)
+
+# Serialises increments against the in-memory fallback store
+_local_lock = threading.Lock()
+
+
+def parse_increments(data):
+    """Return ``(increments, error_message)`` from a progress request body."""
+    increments = {}
+    for counter in CHILD_COUNTERS:
+        if counter not in data:
+            continue
+        value = data[counter]
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            return None, f'{counter} must be a non-negative integer'
+        if value:
+            increments[counter] = value
+    if not increments:
+        return None, f'Provide at least one of: {", ".join(CHILD_COUNTERS)}'
+    return increments, None
+
+
+def apply_child_progress(user, child_id, increments, repo=None):
+    """Add ``increments`` to a child's counters and the parent's points total."""
+    email = user['email']
+    if repo:
+        # Older records derive the total from the children; the repository
+        # stores it in the same write as the increment.
+        repo.increment_child_progress(email, child_id, increments,
+                                      backfill_points=user.get('points') is None)
+    else:
+        with _local_lock:
+            record = users_db[email]
+            if record.get('points') is None:
+                record['points'] = derived_points(record)
+            progress = record.setdefault('child_progress', {}).setdefault(str(child_id), {})
+            for counter, amount in increments.items():
+                progress[counter] = progress.get(counter, 0) + amount
+            record['points'] += increments.get('points', 0)
+            record['profile_version'] = record.get('profile_version', 0) + 1
+    profile_versions.bump(user['id'])
+    leaderboard_service.add_points(child_id, increments.get('points', 0))
+
+
+@progress_bp.route('/children/<child_id>', methods=['POST', 'OPTIONS'])
+@jwt_required()
+def record_child_progress(child_id):
+    """Add to a child's points, lessonsCompleted, testsAttended and totalTime"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        increments, error = parse_increments(request.get_json(silent=True) or {})
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            }), 400
+
+        repo = get_firestore_repo()
+        user = fetch_user_by_id(get_jwt_identity(), repo)
+        if not user:
+            return jsonify({
+                'success': False,
+                'message': 'User not found',
+                'error': 'user_not_found'
+            }), 404
+
+        if not any(str(child.get('id')) == child_id for child in user.get('children', [])):
+            return jsonify({
+                'success': False,
+                'message': 'Child not found',
+                'error': 'child_not_found'
+            }), 404
+
+        apply_child_progress(user, child_id, increments, repo)
+
+        return jsonify({
+            'success': True,
+            'message': 'Progress recorded',
+            'data': {
+                'childId': child_id,
+                'increments': increments
+            }
+        }), 200
+
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
+    except Exception as e:
+        logger.exception("Progress update failed")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to record progress',
+            'error': str(e)
+        }), 500
@@ -0,0 +1,38 @@
+"""Per-child progress counters maintained with atomic increments.
+
+A child's entry in the embedded ``children`` list holds the counters it was
+created with. Progress updates never rewrite that list: they apply
+server-side increments to ``child_progress.<child_id>.<counter>`` and to the
+parent's top-level ``points`` in a single document update, so concurrent
+updates from two devices cannot overwrite each other. Reads add the
+increments to the base counters with :func:`merged_children`.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+CHILD_COUNTERS = ("points", "lessonsCompleted", "testsAttended", "totalTime")
+
+
+def merged_children(user_record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return ``children`` with their ``child_progress`` increments applied."""
+    children = user_record.get("children", [])
+    progress = user_record.get("child_progress") or {}
+    if not progress:
+        return children
+
+    merged = []
+    for child in children:
+        increments = progress.get(str(child.get("id")))
+        if increments:
+            child = dict(child)
+            for counter in CHILD_COUNTERS:
+                if counter in increments:
+                    child[counter] = child.get(counter, 0) + increments[counter]
+        merged.append(child)
+    return merged
+
+
+def derived_points(user_record: Dict[str, Any]) -> int:
+    """Total points of the children, for older records without a stored ``points``."""
+    return sum(child.get("points", 0) for child in merged_children(user_record))
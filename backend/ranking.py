@@ -0,0 +1,352 @@
+"""In-memory ranked index of children by points.
+
+:class:`SortedKeyList` keeps keys in a list of short sorted sublists (at most
+``2 * load`` keys each) plus a Fenwick tree over the sublist lengths. Finding
+a key is a bisect over the sublist maxima followed by a bisect inside one
+sublist, and its overall position is a Fenwick prefix sum. Rank lookups are
+therefore O(log n), and inserts and removals cost O(log n) plus a shift of at
+most ``2 * load`` items. Iterating from any position, which is how top-N is
+served, costs O(log n) to find the start and O(1) per item after that.
+
+:class:`Leaderboard` ranks children by descending points (ties broken by
+child id) on top of it and keeps a child id -> entry map for updates.
+:class:`LeaderboardService` loads it from the repository on a background
+thread at startup and rebuilds it every ``refresh_seconds``; writes made by
+this process update it in between. Until the first load finishes, reads
+raise :class:`LeaderboardLoadingError` instead of waiting for the scan.
+Each worker keeps its own copy, so points earned through another worker
+show up after this worker's next rebuild.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from progress_counters import merged_children
+from settings import env_float
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[int, str]
+
+
+class SortedKeyList:
+    """Sorted list of unique keys with O(log n) rank and positional access."""
+
+    def __init__(self, load: int = 1000):
+        if load < 2:
+            raise ValueError("load must be at least 2")
+        self._load = load
+        self._lists: List[List[Any]] = []
+        self._maxes: List[Any] = []
+        self._tree: List[int] = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def load(self, keys: Iterable[Any]) -> None:
+        """Replace the contents with ``keys`` (need not be sorted)."""
+        ordered = sorted(keys)
+        self._lists = [ordered[i:i + self._load] for i in range(0, len(ordered), self._load)]
+        self._maxes = [sublist[-1] for sublist in self._lists]
+        self._len = len(ordered)
+        self._build_tree()
+
+    def _build_tree(self) -> None:
+        tree = [len(sublist) for sublist in self._lists]
+        for i in range(len(tree)):
+            parent = i | (i + 1)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, index: int, delta: int) -> None:
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index |= index + 1
+
+    def _tree_prefix(self, index: int) -> int:
+        """Number of keys in sublists before ``index``."""
+        total = 0
+        index -= 1
+        while index >= 0:
+            total += self._tree[index]
+            index = (index & (index + 1)) - 1
+        return total
+
+    def _tree_find(self, position: int) -> Tuple[int, int]:
+        """Return ``(sublist index, offset)`` of the key at ``position``."""
+        index = -1
+        step = 1 << (len(self._tree).bit_length())
+        while step:
+            candidate = index + step
+            if candidate < len(self._tree) and self._tree[candidate] <= position:
+                index = candidate
+                position -= self._tree[candidate]
+            step >>= 1
+        return index + 1, position
+
+    def add(self, key: Any) -> None:
+        if not self._maxes:
+            self._lists.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._build_tree()
+            return
+        index = min(bisect_left(self._maxes, key), len(self._maxes) - 1)
+        sublist = self._lists[index]
+        insort(sublist, key)
+        self._maxes[index] = sublist[-1]
+        self._len += 1
+        if len(sublist) > 2 * self._load:
+            self._lists[index:index + 1] = [sublist[:self._load], sublist[self._load:]]
+            self._maxes[index:index + 1] = [self._lists[index][-1], self._lists[index + 1][-1]]
+            self._build_tree()
+        else:
+            self._tree_add(index, 1)
+
+    def remove(self, key: Any) -> None:
+        """Remove ``key``; raises ``ValueError`` if it is not present."""
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            raise ValueError(key)
+        sublist = self._lists[index]
+        offset = bisect_left(sublist, key)
+        if offset == len(sublist) or sublist[offset] != key:
+            raise ValueError(key)
+        del sublist[offset]
+        self._len -= 1
+        if sublist:
+            self._maxes[index] = sublist[-1]
+            self._tree_add(index, -1)
+        else:
+            del self._lists[index]
+            del self._maxes[index]
+            self._build_tree()
+
+    def index(self, key: Any) -> Optional[int]:
+        """Zero-based position of ``key``, or None if it is not present."""
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            return None
+        sublist = self._lists[index]
+        offset = bisect_left(sublist, key)
+        if offset == len(sublist) or sublist[offset] != key:
+            return None
+        return self._tree_prefix(index) + offset
+
+    def count_before(self, key: Any) -> int:
+        """Number of keys that sort strictly before ``key``."""
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            return self._len
+        return self._tree_prefix(index) + bisect_left(self._lists[index], key)
+
+    def islice(self, start: int, stop: int) -> Iterator[Any]:
+        """Yield the keys at positions ``start`` (inclusive) to ``stop`` (exclusive)."""
+        start = max(0, start)
+        stop = min(stop, self._len)
+        if start >= stop:
+            return
+        index, offset = self._tree_find(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = self._lists[index][offset:offset + remaining]
+            yield from chunk
+            remaining -= len(chunk)
+            index += 1
+            offset = 0
+
+
+class Leaderboard:
+    """Children ranked by points, updated incrementally.
+
+    Entries are dicts with at least ``childId`` and ``points``; any other
+    fields (name, level, avatar) are returned as is.
+    """
+
+    def __init__(self, load: int = 1000):
+        self._load = load
+        self._lock = threading.Lock()
+        self._ranked = SortedKeyList(load)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(entry: Dict[str, Any]) -> Key:
+        return (-int(entry["points"]), entry["childId"])
+
+    def load(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """Replace every entry, e.g. after a rebuild from the repository."""
+        by_child = {str(entry["childId"]): dict(entry, childId=str(entry["childId"]))
+                    for entry in entries}
+        ranked = SortedKeyList(self._load)
+        ranked.load(self._key(entry) for entry in by_child.values())
+        with self._lock:
+            self._entries = by_child
+            self._ranked = ranked
+
+    def update(self, entry: Dict[str, Any]) -> None:
+        """Insert or replace one child's entry."""
+        entry = dict(entry, childId=str(entry["childId"]))
+        with self._lock:
+            current = self._entries.get(entry["childId"])
+            if current is not None:
+                self._ranked.remove(self._key(current))
+            self._entries[entry["childId"]] = entry
+            self._ranked.add(self._key(entry))
+
+    def add_points(self, child_id: str, delta: int) -> bool:
+        """Add ``delta`` points to a known child; returns False if it is unknown."""
+        child_id = str(child_id)
+        with self._lock:
+            current = self._entries.get(child_id)
+            if current is None:
+                return False
+            self._ranked.remove(self._key(current))
+            current["points"] = int(current["points"]) + delta
+            self._ranked.add(self._key(current))
+            return True
+
+    def remove(self, child_id: str) -> None:
+        with self._lock:
+            current = self._entries.pop(str(child_id), None)
+            if current is not None:
+                self._ranked.remove(self._key(current))
+
+    def top(self, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """Entries ranked ``offset + 1`` to ``offset + limit``, with ``rank`` set.
+
+        Children with equal points share a rank (1, 2, 2, 4, ...).
+        """
+        with self._lock:
+            results = []
+            for position, key in enumerate(self._ranked.islice(offset, offset + limit), offset):
+                entry = dict(self._entries[key[1]])
+                if results and results[-1]["points"] == entry["points"]:
+                    entry["rank"] = results[-1]["rank"]
+                else:
+                    entry["rank"] = self._ranked.count_before((key[0], "")) + 1
+                results.append(entry)
+            return results
+
+    def rank(self, child_id: str) -> Optional[Dict[str, Any]]:
+        """The child's entry with its ``rank``, or None if it is not ranked."""
+        with self._lock:
+            current = self._entries.get(str(child_id))
+            if current is None:
+                return None
+            points_key = (-int(current["points"]), "")
+            return dict(current, rank=self._ranked.count_before(points_key) + 1,
+                        total=len(self._entries))
+
+
+class LeaderboardLoadingError(RuntimeError):
+    """The board has not finished its first load yet."""
+
+    retry_after = 5.0
+
+
+def child_entries(user_record: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Leaderboard entries for every child of a user record."""
+    for child in merged_children(user_record):
+        if child.get("id") is None:
+            continue
+        yield {
+            "childId": str(child["id"]),
+            "name": child.get("name"),
+            "avatar": child.get("avatar"),
+            "level": child.get("level", 1),
+            "points": int(child.get("points", 0)),
+        }
+
+
+class LeaderboardService:
+    """A :class:`Leaderboard` kept in step with the repository.
+
+    ``loader`` returns every entry; it is set by the module that owns the
+    repository (see ``leaderboard.py``).
+    """
+
+    def __init__(self, loader: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None,
+                 refresh_seconds: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.board = Leaderboard()
+        self.loader = loader
+        self._refresh_seconds = refresh_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self._rebuilding = False
+
+    @property
+    def refresh_seconds(self) -> float:
+        if self._refresh_seconds is None:
+            return env_float("LEADERBOARD_REFRESH_SECONDS", 300.0)
+        return self._refresh_seconds
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def start_loading(self) -> None:
+        """Rebuild on a background thread unless a rebuild is already running."""
+        if not self._rebuilding:
+            threading.Thread(target=self._rebuild_quietly, name="leaderboard-rebuild",
+                             daemon=True).start()
+
+    def ensure_loaded(self) -> None:
+        """Raise :class:`LeaderboardLoadingError` until loaded; refresh when stale.
+
+        Neither case waits for the scan: a missing or stale board starts a
+        background rebuild (retrying one that failed) and the request moves on.
+        """
+        if self._loaded_at is None:
+            self.start_loading()
+            raise LeaderboardLoadingError("leaderboard is still loading")
+        if self._clock() - self._loaded_at >= self.refresh_seconds:
+            self.start_loading()
+
+    def reset_after_fork(self) -> None:
+        """Forget a rebuild that was running in the parent; its thread is gone."""
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def rebuild(self) -> None:
+        """Replace the board with a fresh scan of the repository."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        try:
+            started = self._clock()
+            self.board.load(self.loader() if self.loader else ())
+            self._loaded_at = started
+            logger.info("Leaderboard rebuilt with %d children in %.2fs",
+                        len(self.board), self._clock() - started)
+        finally:
+            self._rebuilding = False
+
+    def _rebuild_quietly(self) -> None:
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Leaderboard rebuild failed")
+
+    def record_user(self, user_record: Dict[str, Any]) -> None:
+        """Insert or refresh every child of ``user_record``."""
+        for entry in child_entries(user_record):
+            self.board.update(entry)
+
+    def add_points(self, child_id: str, delta: int) -> None:
+        if delta:
+            self.board.add_points(child_id, delta)
+
+
+leaderboard_service = LeaderboardService()
@@ -0,0 +1,261 @@
+"""Token-bucket rate limiting for the credential endpoints.
+
+Each limit is a bucket of ``burst`` tokens refilled at ``rate`` tokens per
+second; a request takes one token or is rejected with the time until the
+next token is available. Buckets are keyed by limit name and value, e.g.
+``login_ip:203.0.113.7`` or ``login_email:parent@example.com``.
+
+Two backends are available, selected with ``RATE_LIMIT_BACKEND``:
+
+``sqlite`` (default)
+    A WAL-mode SQLite file shared by every worker process on the host, so a
+    client cannot multiply its allowance by the number of workers.
+``memory``
+    A per-process dictionary, suitable for single-process development servers.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from settings import env_bool, env_float, env_int, env_str, state_path
+
+logger = logging.getLogger(__name__)
+
+
+class Limit(NamedTuple):
+    """``burst`` requests at once, refilled at ``per_minute`` requests per minute."""
+
+    per_minute: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+def _refill(tokens: float, updated_at: float, now: float, limit: Limit) -> float:
+    return min(float(limit.burst), tokens + max(0.0, now - updated_at) * limit.rate)
+
+
+def _full_at(tokens: float, now: float, limit: Limit) -> float:
+    if limit.rate <= 0:
+        return math.inf
+    return now + (limit.burst - tokens) / limit.rate
+
+
+def _take(tokens: float, limit: Limit) -> Tuple[Decision, float]:
+    if tokens >= 1.0:
+        return Decision(True, int(tokens - 1.0), 0.0), tokens - 1.0
+    wait = (1.0 - tokens) / limit.rate if limit.rate > 0 else math.inf
+    return Decision(False, 0, wait), tokens
+
+
+class MemoryRateLimiter:
+    """In-process token buckets."""
+
+    def __init__(self, prune_interval: float = 60.0, clock: Callable[[], float] = time.time):
+        self._prune_interval = prune_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._next_prune = clock() + prune_interval
+
+    def hit(self, key: str, limit: Limit) -> Decision:
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (float(limit.burst), now, 0.0))
+            decision, tokens = _take(_refill(tokens, updated_at, now, limit), limit)
+            self._buckets[key] = (tokens, now, _full_at(tokens, now, limit))
+            if now >= self._next_prune:
+                self._prune(now)
+        return decision
+
+    def _prune(self, now: float) -> None:
+        # A bucket that has refilled completely is the same as no bucket.
+        self._next_prune = now + self._prune_interval
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteRateLimiter:
+    """Host-wide token buckets stored in a WAL-mode SQLite database.
+
+    Each hit is one short ``BEGIN IMMEDIATE`` transaction, so concurrent
+    workers never both spend the last token. Each thread (and each forked
+    process) opens its own connection lazily.
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+        " key TEXT PRIMARY KEY,"
+        " tokens REAL NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " full_at REAL NOT NULL"
+        ") WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS rate_limit_buckets_full_at"
+        " ON rate_limit_buckets (full_at)",
+    )
+
+    def __init__(
+        self,
+        path: str,
+        prune_interval: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._path = path
+        self._prune_interval = prune_interval
+        self._clock = clock
+        self._local = threading.local()
+        self._next_prune = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self._SCHEMA:
+            conn.execute(statement)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key: str, limit: Limit) -> Decision:
+        now = self._clock()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (float(limit.burst), now)
+            decision, tokens = _take(_refill(tokens, updated_at, now, limit), limit)
+            full_at = _full_at(tokens, now, limit)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at, full_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, tokens, now, full_at if math.isfinite(full_at) else 1e308),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            # A failed COMMIT (e.g. SQLITE_BUSY) leaves the transaction open;
+            # roll it back so the next BEGIN IMMEDIATE on this connection works.
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        if now >= self._next_prune:
+            self.prune()
+        return decision
+
+    def prune(self) -> int:
+        """Delete buckets that have refilled completely; returns how many."""
+        now = self._clock()
+        self._next_prune = now + self._prune_interval
+        cursor = self._connection().execute(
+            "DELETE FROM rate_limit_buckets WHERE full_at <= ?", (now,)
+        )
+        if cursor.rowcount:
+            logger.debug("Pruned %d idle rate limit buckets", cursor.rowcount)
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+
+
+def create_rate_limiter():
+    """Build the limiter backend selected by ``RATE_LIMIT_BACKEND``."""
+    backend = (env_str("RATE_LIMIT_BACKEND", "sqlite") or "sqlite").lower()
+    prune_interval = env_float("RATE_LIMIT_PRUNE_SECONDS", 60.0)
+
+    if backend == "memory":
+        return MemoryRateLimiter(prune_interval=prune_interval)
+    if backend == "sqlite":
+        path = env_str("RATE_LIMIT_PATH") or state_path("rate_limit.sqlite3")
+        return SQLiteRateLimiter(path, prune_interval=prune_interval)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{backend}'")
+
+
+def configured_limit(name: str, per_minute: float, burst: int) -> Limit:
+    """Read ``RATE_LIMIT_<NAME>_PER_MINUTE`` and ``RATE_LIMIT_<NAME>_BURST``."""
+    return Limit(
+        per_minute=env_float(f"RATE_LIMIT_{name}_PER_MINUTE", per_minute),
+        burst=env_int(f"RATE_LIMIT_{name}_BURST", burst),
+    )
+
+
+class RateLimiter:
+    """Checks requests against the configured limits and counts rejections."""
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self.rejections: Dict[str, int] = {}
+        self.enabled = env_bool("RATE_LIMIT_ENABLED", True)
+        self.send_headers = env_bool("RATE_LIMIT_HEADERS", True)
+        self.trusted_proxies = env_int("RATE_LIMIT_TRUSTED_PROXIES", 0)
+        self.limits = {
+            "login_ip": configured_limit("LOGIN_IP", 30, 10),
+            "login_email": configured_limit("LOGIN_EMAIL", 10, 5),
+            "signup_ip": configured_limit("SIGNUP_IP", 10, 5),
+        }
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = create_rate_limiter()
+        return self._backend
+
+    def check(self, name: str, value: str) -> Decision:
+        """Spend a token from the ``name`` bucket for ``value``."""
+        limit = self.limits[name]
+        if not self.enabled or limit.burst <= 0:
+            return Decision(True, limit.burst, 0.0)
+        try:
+            decision = self.backend.hit(f"{name}:{value}", limit)
+        except sqlite3.Error:
+            # Fail open: a locked or unwritable database must not block logins.
+            logger.warning("Rate limit check failed for %s", name, exc_info=True)
+            return Decision(True, limit.burst, 0.0)
+        if not decision.allowed:
+            with self._lock:
+                self.rejections[name] = self.rejections.get(name, 0) + 1
+        return decision
+
+    def headers(self, name: str, decision: Decision) -> Dict[str, str]:
+        """Response headers for a rejected request."""
+        if not self.send_headers:
+            return {}
+        return {
+            "Retry-After": str(max(1, math.ceil(min(decision.retry_after, 86400)))),
+            "X-RateLimit-Limit": str(self.limits[name].burst),
+            "X-RateLimit-Remaining": str(decision.remaining),
+        }
+
+
+def client_ip(environ: Dict[str, str], remote_addr: Optional[str], trusted_proxies: int) -> str:
+    """Client address, taken from ``X-Forwarded-For`` behind ``trusted_proxies`` proxies."""
+    if trusted_proxies > 0:
+        forwarded = [part.strip() for part in environ.get("HTTP_X_FORWARDED_FOR", "").split(",")]
+        forwarded = [part for part in forwarded if part]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return remote_addr or "unknown"
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,319 @@
+"""Deadline budgets and a circuit breaker for user repository calls.
+
+Each request gets a deadline from its endpoint's budget
+(``REQUEST_DEADLINE_SECONDS``, overridden per endpoint with
+``DEADLINE_BUDGETS``). Repositories ask :func:`call_timeout` for the timeout
+of every datastore call, so a request never waits on the datastore past its
+deadline; calls made outside a request (background flushers, leaderboard
+rebuilds) get the per-call default.
+
+:class:`CircuitBreaker` opens after ``failure_threshold`` consecutive
+failures or slow calls. While open, guarded calls fail immediately with
+:class:`CircuitOpenError` instead of tying up a worker thread; after
+``open_seconds`` one trial call is let through, and its outcome closes or
+re-opens the circuit. Callers turn :class:`RepositoryUnavailableError`
+into a 503, or serve stale cached data when they have it.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from flask import Flask, g, request
+
+from settings import env_bool, env_float, env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryUnavailableError(RuntimeError):
+    """The datastore is failing or the request ran out of time for it."""
+
+    retry_after = 1.0
+
+
+class DeadlineExceededError(RepositoryUnavailableError):
+    """Raised before a datastore call when the request deadline has passed."""
+
+
+class CircuitOpenError(RepositoryUnavailableError):
+    """Raised instead of calling the datastore while the circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open")
+        self.retry_after = retry_after
+
+
+# Budgets in seconds for endpoints whose datastore work is a single lookup.
+# A budget of 0 means no deadline: streaming exports read pages for as long
+# as the download runs, each call still capped by the per-call timeout.
+DEFAULT_DEADLINE_BUDGETS: Dict[str, float] = {
+    "auth.verify_token": 2.0,
+    "auth.refresh": 2.0,
+    "auth.get_current_user": 2.0,
+    "get_profile": 2.0,
+    "export.export_children": 0.0,
+}
+
+_deadline: ContextVar[Optional[float]] = ContextVar("datastore_deadline", default=None)
+
+
+def parse_budgets(value: Optional[str]) -> Dict[str, float]:
+    """Parse ``endpoint=seconds`` pairs separated by commas."""
+    budgets: Dict[str, float] = {}
+    for item in (value or "").split(","):
+        endpoint, _, seconds = item.partition("=")
+        if endpoint.strip() and seconds.strip():
+            try:
+                budgets[endpoint.strip()] = float(seconds)
+            except ValueError:
+                logger.warning("Ignoring invalid deadline budget %r", item)
+    return budgets
+
+
+def set_deadline(seconds: Optional[float]):
+    """Start a deadline ``seconds`` from now; returns a token for :func:`clear_deadline`."""
+    return _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def clear_deadline(token) -> None:
+    _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def call_timeout(default: float) -> float:
+    """Timeout for one datastore call: ``default`` capped by the remaining budget."""
+    remaining = remaining_budget()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceededError("request deadline exceeded")
+    return min(default, remaining)
+
+
+def deadline_budgets() -> Tuple[float, Dict[str, float]]:
+    """Return the default budget and the per-endpoint budgets, in seconds."""
+    default = env_float("REQUEST_DEADLINE_SECONDS", 5.0)
+    return default, dict(DEFAULT_DEADLINE_BUDGETS, **parse_budgets(env_str("DEADLINE_BUDGETS")))
+
+
+def init_deadlines(app: Flask) -> None:
+    """Give every request a datastore deadline from its endpoint's budget."""
+    default, budgets = deadline_budgets()
+
+    @app.before_request
+    def _start_deadline():
+        g._deadline_token = set_deadline(budgets.get(request.endpoint, default))
+
+    @app.teardown_request
+    def _clear_deadline(exc):
+        token = g.pop("_deadline_token", None)
+        if token is not None:
+            clear_deadline(token)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        slow_call_seconds: float = 2.0,
+        open_seconds: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self._failure_threshold = max(1, failure_threshold)
+        self._slow_call_seconds = slow_call_seconds
+        self._open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self._open_seconds:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def before_call(self) -> None:
+        """Raise :class:`CircuitOpenError` unless a call may go ahead now."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+            retry_after = max(1.0, self._open_seconds - (self._clock() - self._opened_at))
+        raise CircuitOpenError(self.name, retry_after)
+
+    def release(self) -> None:
+        """Forget a call that was allowed but never reached the datastore."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record(self, elapsed: float, failed: bool) -> None:
+        """Record the outcome of a call allowed by :meth:`before_call`."""
+        slow = not failed and elapsed >= self._slow_call_seconds
+        with self._lock:
+            self._trial_in_flight = False
+            if failed:
+                self.failures += 1
+            if slow:
+                self.slow_calls += 1
+            if not (failed or slow):
+                self.consecutive_failures = 0
+                if self._state != self.CLOSED:
+                    logger.info("%s circuit closed", self.name)
+                self._state = self.CLOSED
+                return
+            self.consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self.consecutive_failures >= self._failure_threshold:
+                if self._state != self.OPEN:
+                    self.trips += 1
+                    logger.warning(
+                        "%s circuit opened after %d failed or slow calls",
+                        self.name, self.consecutive_failures,
+                    )
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self._failure_threshold,
+                "slow_call_seconds": self._slow_call_seconds,
+                "open_seconds": self._open_seconds,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+            }
+
+
+def create_circuit_breaker(name: str) -> Optional[CircuitBreaker]:
+    """Build a breaker from ``CIRCUIT_BREAKER_*`` settings, or None if disabled."""
+    if not env_bool("CIRCUIT_BREAKER_ENABLED", True):
+        return None
+    return CircuitBreaker(
+        name,
+        failure_threshold=env_int("CIRCUIT_BREAKER_FAILURE_THRESHOLD", 5),
+        slow_call_seconds=env_float("CIRCUIT_BREAKER_SLOW_CALL_SECONDS", 2.0),
+        open_seconds=env_float("CIRCUIT_BREAKER_OPEN_SECONDS", 10.0),
+    )
+
+
+# Repository methods that make one bounded set of datastore calls. Streaming
+# scans (iter_users) and maintenance jobs are left unguarded.
+GUARDED_METHODS = frozenset({
+    "get_user_by_email",
+    "get_user_by_id",
+    "get_users_by_emails",
+    "get_users_by_ids",
+    "create_user",
+    "update_user",
+    "increment_child_progress",
+    "batch_update",
+    "append_events",
+})
+
+
+class GuardedUserRepository:
+    """Route repository calls through a :class:`CircuitBreaker`.
+
+    Exceptions for which ``is_outage`` returns True count as failures and are
+    re-raised as :class:`RepositoryUnavailableError`; any other exception
+    means the datastore answered and is passed through unchanged.
+    """
+
+    def __init__(self, repository: Any, breaker: CircuitBreaker,
+                 is_outage: Callable[[BaseException], bool],
+                 guarded: Iterable[str] = GUARDED_METHODS):
+        self._repository = repository
+        self._breaker = breaker
+        self._is_outage = is_outage
+        self._guarded = frozenset(guarded)
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._breaker
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._repository, name)
+        if name not in self._guarded:
+            return attr
+
+        def guarded_call(*args: Any, **kwargs: Any) -> Any:
+            self._breaker.before_call()
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except DeadlineExceededError:
+                self._breaker.release()
+                raise
+            except Exception as exc:
+                outage = self._is_outage(exc)
+                self._breaker.record(time.perf_counter() - started, failed=outage)
+                if outage:
+                    raise RepositoryUnavailableError(str(exc) or type(exc).__name__) from exc
+                raise
+            self._breaker.record(time.perf_counter() - started, failed=False)
+            return result
+
+        return guarded_call
+
+
+class AsyncGuardedUserRepository(GuardedUserRepository):
+    """Async counterpart of :class:`GuardedUserRepository`."""
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._repository, name)
+        if name not in self._guarded:
+            return attr
+
+        async def guarded_call(*args: Any, **kwargs: Any) -> Any:
+            self._breaker.before_call()
+            started = time.perf_counter()
+            try:
+                result = await attr(*args, **kwargs)
+            except DeadlineExceededError:
+                self._breaker.release()
+                raise
+            except Exception as exc:
+                outage = self._is_outage(exc)
+                self._breaker.record(time.perf_counter() - started, failed=outage)
+                if outage:
+                    raise RepositoryUnavailableError(str(exc) or type(exc).__name__) from exc
+                raise
+            self._breaker.record(time.perf_counter() - started, failed=False)
+            return result
+
+        return guarded_call
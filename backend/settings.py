@@ -0,0 +1,62 @@
+"""Environment-variable helpers shared by the BuddySign backend modules."""
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+
+def str_to_bool(value, default=False):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in {"1", "true", "t", "yes", "y"}
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """Read a boolean flag from the environment."""
+    return str_to_bool(os.getenv(name), default)
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer from the environment, falling back on blank values."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float from the environment, falling back on blank values."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+def env_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a stripped string from the environment, treating blanks as unset."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip()
+
+
+def state_path(filename: str) -> str:
+    """Path of ``filename`` in the directory holding host-shared state files.
+
+    The directory is ``STATE_DIR`` or ``backend/instance``, created with mode
+    0700. It must belong to the current user and be closed to everyone else,
+    since another local user who could replace these files could, for example,
+    un-revoke tokens.
+    """
+    directory = env_str("STATE_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "instance"
+    )
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(
+            f"State directory {directory} must be owned by this user with mode 0700"
+        )
+    return os.path.join(directory, filename)
@@ -0,0 +1,248 @@
+"""SQLite-backed user repository for installs without Firebase.
+
+Implements the same interface as ``FirestoreUserRepository`` on a WAL-mode
+SQLite file, so every worker process on the host sees the same users and
+the data survives restarts. Each user is stored as a JSON document next to
+indexed ``email`` (primary key) and ``id`` columns, so both lookups are
+index probes. Each thread (and each forked process) opens its own
+connection lazily; writes that read before they write run in
+``BEGIN IMMEDIATE`` transactions so concurrent increments are not lost.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from firebase_client import UserAlreadyExistsError
+from instrumentation import instrumented
+from progress_counters import derived_points
+from resilience import call_timeout
+from settings import env_float, env_str, state_path
+from user_cache import project_user
+
+logger = logging.getLogger(__name__)
+
+
+# Host parameters bound per ``IN (...)`` query; well under SQLite's limit.
+MAX_SQL_VARIABLES = 500
+
+
+def is_sqlite_outage(exc: BaseException) -> bool:
+    """True for errors such as a locked or unreadable database file."""
+    return isinstance(exc, sqlite3.OperationalError)
+
+
+class SQLiteUserRepository:
+    """User repository stored in a WAL-mode SQLite database."""
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS users ("
+        " email TEXT PRIMARY KEY,"
+        " id TEXT,"
+        " data TEXT NOT NULL"
+        ") WITHOUT ROWID",
+        "CREATE UNIQUE INDEX IF NOT EXISTS users_id ON users (id)",
+        "CREATE TABLE IF NOT EXISTS user_events ("
+        " seq INTEGER PRIMARY KEY,"
+        " email TEXT NOT NULL,"
+        " data TEXT NOT NULL"
+        ")",
+        "CREATE INDEX IF NOT EXISTS user_events_email ON user_events (email)",
+    )
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self._path = path
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self._path, timeout=self._timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self._SCHEMA:
+            conn.execute(statement)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a read-modify-write under the database write lock.
+
+        Waiting for the lock is bounded by the request's deadline budget.
+        """
+        conn = self._connection()
+        conn.execute(f"PRAGMA busy_timeout = {int(call_timeout(self._timeout) * 1000)}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            # Also covers a failed COMMIT (e.g. SQLITE_BUSY), which would
+            # otherwise leave this thread's connection inside the transaction.
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _row_to_user(email: str, data: str) -> Dict[str, Any]:
+        user = json.loads(data)
+        user["email"] = email
+        return user
+
+    @staticmethod
+    def _dumps(user: Dict[str, Any]) -> str:
+        return json.dumps(user, separators=(",", ":"), default=str)
+
+    def _select_in(self, column: str, values: List[str]) -> Iterator[sqlite3.Row]:
+        for start in range(0, len(values), MAX_SQL_VARIABLES):
+            chunk = values[start:start + MAX_SQL_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            yield from self._connection().execute(
+                f"SELECT email, data FROM users WHERE {column} IN ({placeholders})", chunk
+            )
+
+    @instrumented("sqlite.get_user_by_email")
+    def get_user_by_email(self, email: str,
+                          fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT email, data FROM users WHERE email = ?", (email,)
+        ).fetchone()
+        return project_user(self._row_to_user(*row), fields) if row else None
+
+    @instrumented("sqlite.get_user_by_id")
+    def get_user_by_id(self, user_id: str,
+                       fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT email, data FROM users WHERE id = ?", (str(user_id),)
+        ).fetchone()
+        return project_user(self._row_to_user(*row), fields) if row else None
+
+    @instrumented("sqlite.get_users_by_emails")
+    def get_users_by_emails(self, emails: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch many users; returns ``{email: user}`` for those found."""
+        rows = self._select_in("email", list(dict.fromkeys(emails)))
+        return {email: self._row_to_user(email, data) for email, data in rows}
+
+    @instrumented("sqlite.get_users_by_ids")
+    def get_users_by_ids(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch many users by id; returns ``{user_id: user}`` for those found."""
+        rows = self._select_in("id", list(dict.fromkeys(str(user_id) for user_id in user_ids)))
+        users = (self._row_to_user(email, data) for email, data in rows)
+        return {str(user["id"]): user for user in users}
+
+    @instrumented("sqlite.create_user")
+    def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a user; raises :class:`UserAlreadyExistsError` if the email is taken."""
+        user_id = data.get("id")
+        conn = self._connection()
+        conn.execute(f"PRAGMA busy_timeout = {int(call_timeout(self._timeout) * 1000)}")
+        cursor = conn.execute(
+            "INSERT INTO users (email, id, data) VALUES (?, ?, ?)"
+            " ON CONFLICT (email) DO NOTHING",
+            (email, str(user_id) if user_id is not None else None, self._dumps(data)),
+        )
+        if not cursor.rowcount:
+            raise UserAlreadyExistsError(email)
+        return data
+
+    def _update(self, conn: sqlite3.Connection, email: str, updates: Dict[str, Any]) -> bool:
+        row = conn.execute("SELECT data FROM users WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            return False
+        user = json.loads(row[0])
+        user.update(updates)
+        user_id = user.get("id")
+        conn.execute(
+            "UPDATE users SET id = ?, data = ? WHERE email = ?",
+            (str(user_id) if user_id is not None else None, self._dumps(user), email),
+        )
+        return True
+
+    @instrumented("sqlite.update_user")
+    def update_user(self, email: str, updates: Dict[str, Any]) -> None:
+        """Set top-level fields on an existing user; raises ``KeyError`` if missing."""
+        with self._transaction() as conn:
+            if not self._update(conn, email, updates):
+                raise KeyError(email)
+
+    @instrumented("sqlite.increment_child_progress")
+    def increment_child_progress(self, email: str, child_id: str,
+                                 increments: Dict[str, int], backfill_points: bool = False) -> None:
+        """Add ``increments`` to a child's counters in one transaction.
+
+        ``points`` is also added to the parent's total and ``profile_version``
+        is bumped, matching the Firestore repository. A record without a stored
+        ``points`` total gets it from its children first, whatever
+        ``backfill_points`` says, since the row is read anyway.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM users WHERE email = ?", (email,)).fetchone()
+            if row is None:
+                raise KeyError(email)
+            user = json.loads(row[0])
+            if user.get("points") is None:
+                user["points"] = derived_points(user)
+            progress = user.setdefault("child_progress", {}).setdefault(str(child_id), {})
+            for counter, amount in increments.items():
+                progress[counter] = progress.get(counter, 0) + amount
+            user["points"] += increments.get("points", 0)
+            user["profile_version"] = user.get("profile_version", 0) + 1
+            conn.execute("UPDATE users SET data = ? WHERE email = ?", (self._dumps(user), email))
+
+    @instrumented("sqlite.batch_update")
+    def batch_update(self, updates_by_email: Dict[str, Dict[str, Any]]) -> None:
+        """Apply field updates to many users in one transaction; unknown emails are skipped."""
+        with self._transaction() as conn:
+            for email, updates in updates_by_email.items():
+                if not self._update(conn, email, updates):
+                    logger.warning("Skipped update for unknown user %s", email)
+
+    @instrumented("sqlite.append_events")
+    def append_events(self, events_by_email: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Store events in the ``user_events`` table in one transaction."""
+        rows = [
+            (email, self._dumps(event))
+            for email, events in events_by_email.items()
+            for event in events
+        ]
+        with self._transaction() as conn:
+            conn.executemany("INSERT INTO user_events (email, data) VALUES (?, ?)", rows)
+
+    def iter_users(self, page_size: int = 500,
+                   fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield every user, reading ``page_size`` rows per query.
+
+        Pages are ordered by email and resumed after the last one seen, so a
+        full scan never holds more than one page in memory. Pass ``fields``
+        to keep only those fields.
+        """
+        last_email = ""
+        while True:
+            rows = self._connection().execute(
+                "SELECT email, data FROM users WHERE email > ? ORDER BY email LIMIT ?",
+                (last_email, page_size),
+            ).fetchall()
+            for email, data in rows:
+                yield project_user(self._row_to_user(email, data), fields)
+            if len(rows) < page_size:
+                return
+            last_email = rows[-1][0]
+
+    def backfill_id_index(self, batch_size: int = 400) -> int:
+        """Ids are indexed on write; nothing to backfill."""
+        return 0
+
+
+def create_sqlite_user_repository() -> SQLiteUserRepository:
+    """Build the SQLite repository at ``USER_STORE_PATH``."""
+    path = env_str("USER_STORE_PATH") or state_path("users.sqlite3")
+    return SQLiteUserRepository(path, timeout=env_float("USER_STORE_TIMEOUT_SECONDS", 5.0))
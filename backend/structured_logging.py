@@ -0,0 +1,266 @@
+"""Non-blocking, sampled, structured logging for the request path.
+
+:func:`configure_logging` installs a single root handler that puts records on
+a bounded queue; a :class:`logging.handlers.QueueListener` thread formats
+them (as one JSON object per line by default) and writes them to stderr. A
+request thread therefore only builds the record and enqueues it. When the
+queue is full the record is dropped and counted rather than waiting for the
+writer, and the listener reports how many were dropped once it catches up.
+
+Loggers can be sampled: ``LOG_SAMPLE_RATES`` maps logger names to the
+fraction of their records that are kept (a logger inherits its parent's
+rate). Sampling only applies below WARNING, so warnings and errors are never
+sampled out. The per-lookup logs in ``auth.lookups`` are sampled by default.
+"""
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from settings import env_bool, env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+
+# Fraction of records kept per logger; overridden by LOG_SAMPLE_RATES.
+DEFAULT_SAMPLE_RATES: Dict[str, float] = {
+    "auth.lookups": 0.01,
+}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# LogRecord attributes that are not ``extra=`` fields.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "taskName",
+}
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parse ``logger=rate`` pairs separated by commas."""
+    rates: Dict[str, float] = {}
+    for item in (value or "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            try:
+                rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+            except ValueError:
+                logger.warning("Ignoring invalid log sample rate %r", item)
+    return rates
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, extras."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a configured fraction of each logger's records below WARNING."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self._rates = dict(rates)
+        self._resolved: Dict[str, float] = {}
+        self.sampled_out = 0
+
+    def rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, probe = 1.0, name
+            while probe:
+                if probe in self._rates:
+                    rate = self._rates[probe]
+                    break
+                probe = probe.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now, while they still hold the values being
+        # logged; formatting into the output format is left to the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.enqueued += 1
+
+
+class _ReportingListener(logging.handlers.QueueListener):
+    """Queue listener that logs how many records were dropped while it was behind.
+
+    Drops are reported at most once per ``report_interval`` seconds.
+    """
+
+    def __init__(self, log_queue: queue.Queue, handler: logging.Handler,
+                 source: DroppingQueueHandler, report_interval: float = 10.0):
+        super().__init__(log_queue, handler, respect_handler_level=True)
+        self._source = source
+        self._report_interval = report_interval
+        self._reported = 0
+        self._next_report = 0.0
+
+    def handle(self, record: logging.LogRecord) -> None:
+        dropped = self._source.dropped
+        if dropped > self._reported and time.monotonic() >= self._next_report:
+            self._next_report = time.monotonic() + self._report_interval
+            notice = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "Dropped %d log records because the log queue was full",
+                (dropped - self._reported,), None,
+            )
+            self._reported = dropped
+            super().handle(notice)
+        super().handle(record)
+
+
+_lock = threading.Lock()
+_handler: Optional[logging.Handler] = None
+_listener: Optional[_ReportingListener] = None
+_sampler: Optional[SamplingFilter] = None
+
+
+def _output_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stderr)
+    if (env_str("LOG_FORMAT", "json") or "json").lower() == "text":
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        handler.setFormatter(JSONFormatter())
+    return handler
+
+
+def _start_listener(handler: DroppingQueueHandler, output: logging.Handler) -> None:
+    global _listener
+
+    _listener = _ReportingListener(handler.queue, output, handler)
+    _listener.start()
+
+
+def _restart_in_child() -> None:
+    # The parent's listener thread does not exist after fork, and the queue's
+    # lock may have been held by it; give the child a fresh queue and thread.
+    global _listener
+
+    if isinstance(_handler, DroppingQueueHandler) and _listener is not None:
+        _handler.queue = queue.Queue(_handler.queue.maxsize)
+        _handler.enqueued = _handler.dropped = 0
+        _start_listener(_handler, _listener.handlers[0])
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+
+    listener, _listener = _listener, None
+    if listener is None:
+        return
+    try:
+        listener.stop()
+    except queue.Full:
+        # No room for the stop sentinel; the daemon thread dies with the process.
+        pass
+
+
+def configure_logging() -> bool:
+    """Install the root log handler from ``LOG_*`` settings; returns True if installed.
+
+    Does nothing when ``LOG_CONFIGURE`` is false, when the root logger
+    already has handlers (the host configured logging itself), or on repeat
+    calls.
+    """
+    global _handler, _sampler
+
+    with _lock:
+        root = logging.getLogger()
+        if _handler is not None or root.handlers or not env_bool("LOG_CONFIGURE", True):
+            return False
+
+        _sampler = SamplingFilter(dict(
+            DEFAULT_SAMPLE_RATES, **parse_sample_rates(env_str("LOG_SAMPLE_RATES"))
+        ))
+        output = _output_handler()
+        if env_bool("LOG_ASYNC", True):
+            handler: logging.Handler = DroppingQueueHandler(
+                queue.Queue(env_int("LOG_QUEUE_SIZE", 10000))
+            )
+            _start_listener(handler, output)
+            os.register_at_fork(after_in_child=_restart_in_child)
+            atexit.register(stop_logging)
+        else:
+            handler = output
+        handler.addFilter(_sampler)
+        root.addHandler(handler)
+        root.setLevel((env_str("LOG_LEVEL", "INFO") or "INFO").upper())
+        _handler = handler
+        return True
+
+
+def logging_stats() -> Dict[str, int]:
+    """Records enqueued, dropped and sampled out by this process."""
+    stats: Dict[str, int] = {}
+    if isinstance(_handler, DroppingQueueHandler):
+        stats.update(
+            enqueued=_handler.enqueued,
+            dropped=_handler.dropped,
+            queued=_handler.queue.qsize(),
+        )
+    if _sampler is not None:
+        stats["sampled_out"] = _sampler.sampled_out
+    return stats
@@ -0,0 +1,159 @@
+"""Revoked-token (jti) storage for JWT logout.
+
+Each revoked jti is stored together with the token's ``exp`` so entries can be
+dropped once the token would have expired anyway; memory and disk use stay
+proportional to the number of *live* revoked tokens.
+
+Two backends are available, selected with ``TOKEN_BLOCKLIST_BACKEND``:
+
+``sqlite`` (default)
+    A WAL-mode SQLite file shared by every worker process on the host, so a
+    logout handled by one gunicorn worker is honoured by the others.
+``memory``
+    A per-process dictionary, suitable for single-process development servers.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from settings import env_float, env_str, state_path
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryTokenBlocklist:
+    """In-process blocklist backed by a dict plus an expiry min-heap."""
+
+    def __init__(self, prune_interval: float = 60.0, clock: Callable[[], float] = time.time):
+        self._prune_interval = prune_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._expiry_by_jti: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._next_prune = clock() + prune_interval
+
+    def add(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._expiry_by_jti[jti] = float(expires_at)
+            heapq.heappush(self._heap, (float(expires_at), jti))
+        self._maybe_prune()
+
+    def __contains__(self, jti: object) -> bool:
+        self._maybe_prune()
+        expires_at = self._expiry_by_jti.get(jti)  # type: ignore[arg-type]
+        return expires_at is not None and expires_at > self._clock()
+
+    def __len__(self) -> int:
+        return len(self._expiry_by_jti)
+
+    def _maybe_prune(self) -> None:
+        if self._clock() >= self._next_prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Drop expired entries; returns how many were removed."""
+        now = self._clock()
+        removed = 0
+        with self._lock:
+            self._next_prune = now + self._prune_interval
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, jti = heapq.heappop(self._heap)
+                # Skip stale heap items left behind when a jti was re-added.
+                if self._expiry_by_jti.get(jti) == expires_at:
+                    del self._expiry_by_jti[jti]
+                    removed += 1
+        return removed
+
+
+class SQLiteTokenBlocklist:
+    """Host-wide blocklist stored in a WAL-mode SQLite database.
+
+    Lookups are primary-key probes on a ``WITHOUT ROWID`` table. Each thread
+    (and each forked process) opens its own connection lazily.
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+        " jti TEXT PRIMARY KEY,"
+        " expires_at REAL NOT NULL"
+        ") WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS revoked_tokens_expires_at"
+        " ON revoked_tokens (expires_at)",
+    )
+
+    def __init__(
+        self,
+        path: str,
+        prune_interval: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._path = path
+        self._prune_interval = prune_interval
+        self._clock = clock
+        self._local = threading.local()
+        self._next_prune = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self._SCHEMA:
+            conn.execute(statement)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def add(self, jti: str, expires_at: float) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+            (jti, float(expires_at)),
+        )
+        self._maybe_prune()
+
+    def __contains__(self, jti: object) -> bool:
+        self._maybe_prune()
+        row = self._connection().execute(
+            "SELECT 1 FROM revoked_tokens WHERE jti = ? AND expires_at > ?",
+            (jti, self._clock()),
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM revoked_tokens").fetchone()[0]
+
+    def _maybe_prune(self) -> None:
+        if self._clock() >= self._next_prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Delete expired rows; returns how many were removed."""
+        now = self._clock()
+        self._next_prune = now + self._prune_interval
+        cursor = self._connection().execute(
+            "DELETE FROM revoked_tokens WHERE expires_at <= ?", (now,)
+        )
+        if cursor.rowcount:
+            logger.debug("Pruned %d expired revoked tokens", cursor.rowcount)
+        return cursor.rowcount
+
+
+def create_token_blocklist():
+    """Build the blocklist backend selected by ``TOKEN_BLOCKLIST_BACKEND``."""
+    backend = (env_str("TOKEN_BLOCKLIST_BACKEND", "sqlite") or "sqlite").lower()
+    prune_interval = env_float("TOKEN_BLOCKLIST_PRUNE_SECONDS", 60.0)
+
+    if backend == "memory":
+        return MemoryTokenBlocklist(prune_interval=prune_interval)
+    if backend == "sqlite":
+        path = env_str("TOKEN_BLOCKLIST_PATH") or state_path("token_blocklist.sqlite3")
+        return SQLiteTokenBlocklist(path, prune_interval=prune_interval)
+    raise ValueError(f"Unknown TOKEN_BLOCKLIST_BACKEND '{backend}'")
@@ -0,0 +1,412 @@
+"""Read-through caching for user records fetched from the user repository."""
+from __future__ import annotations
+
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from resilience import RepositoryUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """Bounded LRU cache of user records with a per-entry TTL.
+
+    Entries are stored by email (the Firestore document id) with a secondary
+    id -> email map so lookups by either key share the same entry. Records are
+    deep-copied on the way in and out because request handlers mutate the
+    dictionaries they receive.
+
+    Expired entries are kept for ``stale_seconds`` more, invisible to normal
+    lookups, so they can be served by :meth:`get_stale_by_email` and
+    :meth:`get_stale_by_id` while the user store is unavailable.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        stale_seconds: float = 0.0,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._max_size = max_size
+        self._ttl = ttl_seconds
+        self._stale = stale_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._emails_by_id: Dict[str, str] = {}
+        self._etags: Dict[str, Dict[str, str]] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+
+    @property
+    def generation(self) -> int:
+        """Counter bumped on every invalidation; see :meth:`put`."""
+        return self._generation
+
+    def _drop(self, email: str) -> None:
+        _, record = self._entries.pop(email)
+        self._etags.pop(email, None)
+        user_id = record.get("id")
+        if user_id is not None and self._emails_by_id.get(str(user_id)) == email:
+            del self._emails_by_id[str(user_id)]
+
+    def _lookup(self, email: Optional[str]) -> Optional[Dict[str, Any]]:
+        if email is None or email not in self._entries:
+            self.misses += 1
+            return None
+        expires_at, record = self._entries[email]
+        now = self._clock()
+        if expires_at <= now:
+            if expires_at + self._stale <= now:
+                self._drop(email)
+                self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(email)
+        self.hits += 1
+        return copy.deepcopy(record)
+
+    def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._lookup(email)
+
+    def get_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._lookup(self._emails_by_id.get(str(user_id)))
+
+    def _lookup_stale(self, email: Optional[str]) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(email) if email else None
+        if entry is None or entry[0] + self._stale <= self._clock():
+            return None
+        self.stale_hits += 1
+        return copy.deepcopy(entry[1])
+
+    def get_stale_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for ``email`` even if expired, within the stale window."""
+        with self._lock:
+            return self._lookup_stale(email)
+
+    def get_stale_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._lookup_stale(self._emails_by_id.get(str(user_id)))
+
+    def put(self, record: Dict[str, Any], generation: Optional[int] = None) -> None:
+        """Cache ``record``.
+
+        When ``generation`` is given the write is skipped if any invalidation
+        happened since it was read, so a slow read cannot resurrect data that a
+        concurrent update just invalidated.
+        """
+        email = record.get("email")
+        if not email:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if email in self._entries:
+                self._drop(email)
+            self._entries[email] = (self._clock() + self._ttl, copy.deepcopy(record))
+            if record.get("id") is not None:
+                self._emails_by_id[str(record["id"])] = email
+            while len(self._entries) > self._max_size:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def get_etag(self, user_id: str, variant: str) -> Optional[str]:
+        """Return the ETag remembered for a fresh entry, without touching counters."""
+        with self._lock:
+            email = self._emails_by_id.get(str(user_id))
+            entry = self._entries.get(email) if email else None
+            if entry is None or entry[0] <= self._clock():
+                return None
+            return self._etags.get(email, {}).get(variant)
+
+    def set_etag(self, user_id: str, variant: str, etag: str, generation: int) -> None:
+        """Remember the ETag of a payload built from the cached entry.
+
+        Skipped if the entry was invalidated after ``generation`` was read.
+        """
+        with self._lock:
+            email = self._emails_by_id.get(str(user_id))
+            if generation != self._generation or email not in self._entries:
+                return
+            self._etags.setdefault(email, {})[variant] = etag
+
+    def invalidate(self, email: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if email in self._entries:
+                self._drop(email)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._emails_by_id.clear()
+            self._etags.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "ttl_seconds": self._ttl,
+                "stale_seconds": self._stale,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_hits": self.stale_hits,
+            }
+
+
+def project_user(user: Optional[Dict[str, Any]],
+                 fields: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """Keep only ``fields`` (and ``email``) of a user record; all of it when ``fields`` is None."""
+    if user is None or not fields:
+        return user
+    return {key: user[key] for key in [*fields, "email"] if key in user}
+
+
+def _stale_or_raise(user: Optional[Dict[str, Any]], key: str,
+                    exc: RepositoryUnavailableError) -> Dict[str, Any]:
+    """Return a stale cached user, or re-raise ``exc`` when there is none."""
+    if user is None:
+        raise exc
+    logger.warning("User store unavailable; serving stale cached user %s", key)
+    return user
+
+
+class CachingUserRepository:
+    """Wrap a user repository with a :class:`UserCache`.
+
+    Reads go through the cache; writes are forwarded to the wrapped repository
+    and then refresh (``create_user``) or invalidate (``update_user``,
+    ``increment_child_progress``, ``batch_update``) the cached entry. Any other attribute is delegated to the
+    wrapped repository. Reads that fail with ``RepositoryUnavailableError``
+    are answered from stale entries when the cache still has them.
+    """
+
+    def __init__(self, repository: Any, cache: UserCache):
+        self._repository = repository
+        self._cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._repository, name)
+
+    @property
+    def cache(self) -> UserCache:
+        return self._cache
+
+    def get_user_by_email(self, email: str,
+                          fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Cached user; with ``fields``, only those fields, and a miss is not cached."""
+        user = self._cache.get_by_email(email)
+        if user is not None:
+            return project_user(user, fields)
+        generation = self._cache.generation
+        try:
+            user = self._repository.get_user_by_email(email, fields=fields)
+        except RepositoryUnavailableError as exc:
+            stale = self._cache.get_stale_by_email(email)
+            return project_user(_stale_or_raise(stale, email, exc), fields)
+        if user and not fields:
+            self._cache.put(user, generation)
+        return user
+
+    def get_user_by_id(self, user_id: str,
+                       fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Cached user; with ``fields``, only those fields, and a miss is not cached."""
+        user = self._cache.get_by_id(user_id)
+        if user is not None:
+            return project_user(user, fields)
+        generation = self._cache.generation
+        try:
+            user = self._repository.get_user_by_id(user_id, fields=fields)
+        except RepositoryUnavailableError as exc:
+            stale = self._cache.get_stale_by_id(user_id)
+            return project_user(_stale_or_raise(stale, user_id, exc), fields)
+        if user and not fields:
+            self._cache.put(user, generation)
+        return user
+
+    def get_users_by_emails(self, emails: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for email in dict.fromkeys(emails):
+            user = self._cache.get_by_email(email)
+            if user is not None:
+                found[email] = user
+            else:
+                missing.append(email)
+        if missing:
+            generation = self._cache.generation
+            try:
+                fetched = self._repository.get_users_by_emails(missing)
+            except RepositoryUnavailableError as exc:
+                found.update({
+                    email: _stale_or_raise(self._cache.get_stale_by_email(email), email, exc)
+                    for email in missing
+                })
+                return found
+            for user in fetched.values():
+                self._cache.put(user, generation)
+            found.update(fetched)
+        return found
+
+    def get_users_by_ids(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for user_id in dict.fromkeys(str(user_id) for user_id in user_ids):
+            user = self._cache.get_by_id(user_id)
+            if user is not None:
+                found[user_id] = user
+            else:
+                missing.append(user_id)
+        if missing:
+            generation = self._cache.generation
+            try:
+                fetched = self._repository.get_users_by_ids(missing)
+            except RepositoryUnavailableError as exc:
+                found.update({
+                    user_id: _stale_or_raise(self._cache.get_stale_by_id(user_id), user_id, exc)
+                    for user_id in missing
+                })
+                return found
+            for user in fetched.values():
+                self._cache.put(user, generation)
+            found.update(fetched)
+        return found
+
+    def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        result = self._repository.create_user(email, data)
+        self._cache.invalidate(email)
+        self._cache.put(dict(data, email=email))
+        return result
+
+    def update_user(self, email: str, updates: Dict[str, Any]) -> None:
+        try:
+            self._repository.update_user(email, updates)
+        finally:
+            self._cache.invalidate(email)
+
+    def increment_child_progress(self, email: str, child_id: str,
+                                 increments: Dict[str, int], backfill_points: bool = False) -> None:
+        try:
+            self._repository.increment_child_progress(email, child_id, increments,
+                                                      backfill_points=backfill_points)
+        finally:
+            self._cache.invalidate(email)
+
+    def batch_update(self, updates_by_email: Dict[str, Dict[str, Any]]) -> None:
+        try:
+            self._repository.batch_update(updates_by_email)
+        finally:
+            for email in updates_by_email:
+                self._cache.invalidate(email)
+
+    def peek_etag(self, user_id: str, variant: str) -> Optional[str]:
+        return self._cache.get_etag(user_id, variant)
+
+    def remember_etag(self, user_id: str, variant: str, etag: str, generation: int) -> None:
+        self._cache.set_etag(user_id, variant, etag, generation)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+class AsyncCachingUserRepository:
+    """Async counterpart of :class:`CachingUserRepository`.
+
+    Sharing one :class:`UserCache` between the sync and async repositories
+    keeps invalidations from either path visible to both.
+    """
+
+    def __init__(self, repository: Any, cache: UserCache):
+        self._repository = repository
+        self._cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._repository, name)
+
+    @property
+    def cache(self) -> UserCache:
+        return self._cache
+
+    async def get_user_by_email(self, email: str,
+                                fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Cached user; with ``fields``, only those fields, and a miss is not cached."""
+        user = self._cache.get_by_email(email)
+        if user is not None:
+            return project_user(user, fields)
+        generation = self._cache.generation
+        try:
+            user = await self._repository.get_user_by_email(email, fields=fields)
+        except RepositoryUnavailableError as exc:
+            stale = self._cache.get_stale_by_email(email)
+            return project_user(_stale_or_raise(stale, email, exc), fields)
+        if user and not fields:
+            self._cache.put(user, generation)
+        return user
+
+    async def get_user_by_id(self, user_id: str,
+                             fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Cached user; with ``fields``, only those fields, and a miss is not cached."""
+        user = self._cache.get_by_id(user_id)
+        if user is not None:
+            return project_user(user, fields)
+        generation = self._cache.generation
+        try:
+            user = await self._repository.get_user_by_id(user_id, fields=fields)
+        except RepositoryUnavailableError as exc:
+            stale = self._cache.get_stale_by_id(user_id)
+            return project_user(_stale_or_raise(stale, user_id, exc), fields)
+        if user and not fields:
+            self._cache.put(user, generation)
+        return user
+
+    async def create_user(self, email: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        result = await self._repository.create_user(email, data)
+        self._cache.invalidate(email)
+        self._cache.put(dict(data, email=email))
+        return result
+
+    async def update_user(self, email: str, updates: Dict[str, Any]) -> None:
+        try:
+            await self._repository.update_user(email, updates)
+        finally:
+            self._cache.invalidate(email)
+
+    async def batch_update(self, updates_by_email: Dict[str, Dict[str, Any]]) -> None:
+        try:
+            await self._repository.batch_update(updates_by_email)
+        finally:
+            for email in updates_by_email:
+                self._cache.invalidate(email)
+
+    def peek_etag(self, user_id: str, variant: str) -> Optional[str]:
+        return self._cache.get_etag(user_id, variant)
+
+    def remember_etag(self, user_id: str, variant: str, etag: str, generation: int) -> None:
+        self._cache.set_etag(user_id, variant, etag, generation)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
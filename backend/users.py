@@ -0,0 +1,86 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import logging
+import os
+
+from auth import (
+    fetch_users_by_ids,
+    get_firestore_repo,
+    prepare_user_response,
+    repository_unavailable_response,
+)
+from resilience import RepositoryUnavailableError
+from settings import env_int
+
+logger = logging.getLogger(__name__)
+
+# Create users blueprint
+users_bp = Blueprint('users', __name__)
+
+
+def admin_user_ids():
+    """User ids allowed to read other accounts, from ``ADMIN_USER_IDS``."""
+    return {
+        user_id.strip()
+        for user_id in os.getenv('ADMIN_USER_IDS', '').split(',')
+        if user_id.strip()
+    }
+
+
+def is_admin(user_id):
+    return str(user_id) in admin_user_ids()
+
+
+@users_bp.route('/batch', methods=['POST', 'OPTIONS'])
+@jwt_required()
+def batch_get_users():
+    """Return many users in one request, in the order their ids were given"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        data = request.get_json(silent=True) or {}
+        user_ids = data.get('ids')
+        if not isinstance(user_ids, list) or not user_ids:
+            return jsonify({
+                'success': False,
+                'message': 'ids must be a non-empty list'
+            }), 400
+
+        user_ids = [str(user_id) for user_id in user_ids]
+        max_ids = env_int('USERS_BATCH_MAX_IDS', 500)
+        if len(user_ids) > max_ids:
+            return jsonify({
+                'success': False,
+                'message': f'At most {max_ids} ids can be requested at once'
+            }), 400
+
+        current_user_id = get_jwt_identity()
+        if not is_admin(current_user_id) and set(user_ids) != {current_user_id}:
+            return jsonify({
+                'success': False,
+                'message': 'Not allowed to read other accounts',
+                'error': 'forbidden'
+            }), 403
+
+        users = fetch_users_by_ids(user_ids, get_firestore_repo())
+        return jsonify({
+            'success': True,
+            'data': {
+                'users': [
+                    prepare_user_response(users[user_id]) if user_id in users else None
+                    for user_id in user_ids
+                ],
+                'missing': [user_id for user_id in dict.fromkeys(user_ids) if user_id not in users]
+            }
+        }), 200
+
+    except RepositoryUnavailableError as e:
+        return repository_unavailable_response(e)
+    except Exception as e:
+        logger.exception("Batch user fetch failed")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to fetch users',
+            'error': str(e)
+        }), 500
@@ -0,0 +1,250 @@
+"""Write-behind buffering for low-value user telemetry fields.
+
+Fields such as ``last_login`` are not read in real time, so the request path
+only records them in memory. Updates are coalesced per user (the newest value
+of each field wins) and a background thread hands them to the repository's
+``batch_update`` every ``flush_interval`` seconds, or sooner once
+``max_batch`` users are pending. The buffer holds at most ``max_pending``
+users; beyond that new users' updates are dropped and counted rather than
+blocking the caller.
+
+:class:`EventQueue` applies the same background flushing to append-only
+events: nothing is coalesced, and each flush hands the repository a chunk of
+events grouped by user. Events have already been acknowledged, so a chunk
+that fails because the datastore is unavailable goes back to the front of the
+queue for the next flush; only other errors drop it.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from resilience import RepositoryUnavailableError
+
+logger = logging.getLogger(__name__)
+
+FlushFn = Callable[[Dict[str, Dict[str, Any]]], None]
+EventFlushFn = Callable[[Dict[str, List[Dict[str, Any]]]], None]
+
+
+class _BackgroundFlusher(ABC):
+    """Runs :meth:`flush` on a daemon thread every ``flush_interval`` seconds."""
+
+    _thread_name = "background-flusher"
+
+    def __init__(self, flush_fn: Callable[[Any], None], flush_interval: float,
+                 max_batch: int, max_pending: int):
+        self._flush_fn = flush_fn
+        self._flush_interval = flush_interval
+        self._max_batch = max_batch
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self.submitted = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @abstractmethod
+    def flush(self) -> int:
+        """Write out everything pending now; returns how many items were flushed."""
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork(); start one per process on first use.
+        if self._thread_pid == os.getpid() or self._stopped:
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=self._thread_name, daemon=True
+            )
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("%s iteration failed", self._thread_name)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the flusher and write out anything still pending."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    @abstractmethod
+    def _pending_count(self) -> int:
+        """Items waiting to be flushed; called with ``_lock`` held."""
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending": self._pending_count(),
+                "submitted": self.submitted,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+
+class WriteBehindBuffer(_BackgroundFlusher):
+    """Coalescing, bounded buffer flushed by a background thread."""
+
+    _thread_name = "write-behind-flusher"
+
+    def __init__(
+        self,
+        flush_fn: FlushFn,
+        flush_interval: float = 5.0,
+        max_batch: int = 200,
+        max_pending: int = 10000,
+    ):
+        super().__init__(flush_fn, flush_interval, max_batch, max_pending)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, key: str, fields: Dict[str, Any]) -> bool:
+        """Queue ``fields`` for ``key``; returns False if the update was dropped."""
+        with self._lock:
+            current = self._pending.get(key)
+            if current is None:
+                if len(self._pending) >= self._max_pending:
+                    self.dropped += 1
+                    self._wakeup.set()
+                    return False
+                self._pending[key] = dict(fields)
+            else:
+                current.update(fields)
+            self.submitted += 1
+            pending = len(self._pending)
+        self._ensure_worker()
+        if pending >= self._max_batch:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """Write out everything pending now; returns the number of users flushed."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            items = list(pending.items())
+            written = 0
+            for start in range(0, len(items), self._max_batch):
+                chunk = dict(items[start:start + self._max_batch])
+                try:
+                    self._flush_fn(chunk)
+                    written += len(chunk)
+                except Exception:
+                    # Telemetry is best effort; drop the chunk instead of retrying
+                    # a write that may never succeed (e.g. a deleted user).
+                    self.failed += len(chunk)
+                    logger.exception("Write-behind flush of %d users failed", len(chunk))
+            self.flushed += written
+            return written
+
+    def _pending_count(self) -> int:
+        return len(self._pending)
+
+
+class EventQueue(_BackgroundFlusher):
+    """Bounded FIFO of per-user events flushed by a background thread.
+
+    ``submit_many`` accepts a whole request's events or none of them, so a
+    client that gets a rejection can retry the batch as is.
+    """
+
+    _thread_name = "event-flusher"
+
+    def __init__(
+        self,
+        flush_fn: EventFlushFn,
+        flush_interval: float = 1.0,
+        max_batch: int = 400,
+        max_pending: int = 50000,
+    ):
+        super().__init__(flush_fn, flush_interval, max_batch, max_pending)
+        self._pending: Deque[Tuple[str, Dict[str, Any]]] = deque()
+
+    def submit_many(self, key: str, events: List[Dict[str, Any]]) -> bool:
+        """Queue ``events`` for ``key``; returns False if the queue is full."""
+        with self._lock:
+            if len(self._pending) + len(events) > self._max_pending:
+                self.dropped += len(events)
+                self._wakeup.set()
+                return False
+            self._pending.extend((key, event) for event in events)
+            self.submitted += len(events)
+            pending = len(self._pending)
+        self._ensure_worker()
+        if pending >= self._max_batch:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """Write out everything pending now; returns the number of events flushed."""
+        with self._flush_lock:
+            written = 0
+            while True:
+                with self._lock:
+                    chunk = [self._pending.popleft()
+                             for _ in range(min(self._max_batch, len(self._pending)))]
+                if not chunk:
+                    break
+                grouped: Dict[str, List[Dict[str, Any]]] = {}
+                for key, event in chunk:
+                    grouped.setdefault(key, []).append(event)
+                try:
+                    self._flush_fn(grouped)
+                    written += len(chunk)
+                except RepositoryUnavailableError as e:
+                    requeued = self._requeue(chunk)
+                    logger.warning("Event flush deferred, %d events requeued: %s", requeued, e)
+                    break
+                except Exception:
+                    self.failed += len(chunk)
+                    logger.exception("Event flush of %d events failed", len(chunk))
+            self.flushed += written
+            return written
+
+    def _requeue(self, chunk: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """Put ``chunk`` back at the front, within ``max_pending``; returns how many fit."""
+        with self._lock:
+            room = max(0, self._max_pending - len(self._pending))
+            kept = chunk[len(chunk) - room:] if room < len(chunk) else chunk
+            self.dropped += len(chunk) - len(kept)
+            self._pending.extendleft(reversed(kept))
+            return len(kept)
+
+    def _pending_count(self) -> int:
+        return len(self._pending)
+
+
+def create_write_behind_buffer(flush_fn: FlushFn, **kwargs: Any) -> WriteBehindBuffer:
+    """Create a buffer that is flushed when the interpreter shuts down."""
+    buffer = WriteBehindBuffer(flush_fn, **kwargs)
+    atexit.register(buffer.close)
+    return buffer
+
+
+def create_event_queue(flush_fn: EventFlushFn, **kwargs: Any) -> EventQueue:
+    """Create an event queue that is flushed when the interpreter shuts down."""
+    queue = EventQueue(flush_fn, **kwargs)
+    atexit.register(queue.close)
+    return queue